@@ -1,4 +1,7 @@
-from typing import Tuple
+from typing import Dict, List, Tuple
+import json
+import math
+import numpy as np
 
 class AqiCalculator:
     """ Air Quality Index (AQI) calculator.
@@ -7,41 +10,52 @@ class AqiCalculator:
     def __init__(self):
         self.breakpoints_table = dict()
         self.aqi_recommendations = dict()
+        self.lookup_tables = dict()
+        self.category_payloads = dict()
+        # Upper AQI index of each category, and its name and color
+        self.aqi_category_limits = [50, 100, 150, 200, 300]
+        self.aqi_categories = [
+            ("Good", "00E400"),
+            ("Moderate", "FFFF00"),
+            ("Unhealthy for Sensitive Groups", "FF7E00"),
+            ("Unhealthy", "FF0000"),
+            ("Very Unhealthy", "8F3F97"),
+            ("Hazardous", "7E0023")
+        ]
+        # Concentration resolution of the lookup table of each pollutant
+        self.resolutions = {
+            "o3": 0.001,
+            "pm25": 0.1,
+            "pm10": 1,
+            "co": 0.1,
+            "so2": 1,
+            "no2": 1
+        }
         self._initialize_recommendations()
         self._initialize_breakpoints()
+        self._initialize_lookup_tables()
+        self._initialize_category_payloads()
 
-    def _find_breakpoints(self, pollutant: str, concentration: float) -> list:
-        """Find the AQI value breakpoints that encompass the concentration of a 
-        given pollutant. 
+    def _find_segment(self, pollutant: str, concentration: float) -> int:
+        """Find the breakpoint segment of a concentration in the lookup table 
+        of a pollutant. Concentrations between two segments belong to the 
+        lower one, as if truncated to the resolution of the breakpoints, 
+        instead of getting an AQI of 0.
 
         Args:
             pollutant (str): Name of pollutant (o3, pm25, pm10, co, so2, no2)
             concentration (float): Concentration of the pollutant.
 
         Returns:
-            list: List of tuples with both ranges [(concentration breakpoints), (AQI breakpoints)].
+            int: Index of the breakpoint segment.
         """
-        
-        breakpoints = [] # [(concentration breakpoints), (AQI breakpoints)]
-        
-        pollutant_breakpoints = self.breakpoints_table[pollutant]
-        
-        # Find the breakpoints for AQI and concentration
-        for concentration_breakpoint in pollutant_breakpoints.keys():
-            concentration_lower, concentration_upper = concentration_breakpoint
-            
-            if(concentration_lower <= concentration <= concentration_upper):
-                aqi_breakpoint = pollutant_breakpoints[concentration_breakpoint]
-                
-                breakpoints.append(concentration_breakpoint)
-                breakpoints.append(aqi_breakpoint)
-                
-                return breakpoints
-            
-        return None  
+        table = self.lookup_tables[pollutant]
+        bin_idx = int(concentration * table["bins_per_unit"] + 1e-6)
+        return table["segments_list"][min(bin_idx, table["last_bin"])]
     
     def get_pollutant_aqi_num(self, pollutant: str, concentration: float) -> int:
-        """Calculate the AQI index given the concentration of a pollutant.
+        """Calculate the AQI index given the concentration of a pollutant. 
+        Missing (None or NaN) and infinite concentrations get an AQI of 0.
 
         Args:
             pollutant (str): Name of pollutant (o3, pm25, pm10, co, so2, no2)
@@ -50,28 +64,115 @@ class AqiCalculator:
         Returns:
             int: AQI index.
         """
-        if concentration == 0:
+        if concentration is None or not math.isfinite(concentration) or concentration <= 0:
             return 0
         
-        breakpoints = self._find_breakpoints(pollutant, concentration)
-        aqi_index = 0
+        table = self.lookup_tables[pollutant]
+        segment = self._find_segment(pollutant, concentration)
         
-        if breakpoints:
-            concentration_breakpoint, aqi_breakpoint = breakpoints
-            
-            con_lower, con_upper = concentration_breakpoint
-            aqi_lower, aqi_upper = aqi_breakpoint
-            
-            try: 
-                # Equation to calculate AQI
-                aqi_index = ((aqi_upper - aqi_lower) / (con_upper - con_lower)) 
-                aqi_index *= (concentration - con_lower)
-                aqi_index += aqi_lower
-                aqi_index = round(aqi_index)
-            except ZeroDivisionError:
-                aqi_index = 0
+        # Equation to calculate AQI
+        aqi_index = table["slopes_list"][segment]
+        aqi_index *= (concentration - table["con_lower_list"][segment])
+        aqi_index += table["aqi_lower_list"][segment]
+        return min(round(aqi_index), table["aqi_upper_list"][segment])
+    
+    def get_pollutant_aqi_nums(self, pollutant: str, concentrations: np.ndarray) -> np.ndarray:
+        """Calculate the AQI index for many concentrations of a pollutant at 
+        once. Gives the same result as `get_pollutant_aqi_num` for each value.
+
+        Args:
+            pollutant (str): Name of pollutant (o3, pm25, pm10, co, so2, no2)
+            concentrations (np.ndarray): Concentrations of the pollutant.
+
+        Returns:
+            np.ndarray: AQI index of each concentration.
+        """
+        concentrations = np.asarray(concentrations, dtype=float)
+        table = self.lookup_tables[pollutant]
+        
+        # Missing and infinite concentrations get an AQI of 0, they are set
+        # to 0 so they can be used as indexes
+        valid = np.isfinite(concentrations) & (concentrations > 0)
+        concentrations = np.where(valid, concentrations, 0)
+        
+        # Breakpoint segment of each concentration
+        bin_idx = concentrations * table["bins_per_unit"] + 1e-6
+        bin_idx = bin_idx.clip(0, table["last_bin"]).astype(int)
+        segment = table["segments"][bin_idx]
+        
+        # Equation to calculate AQI
+        aqi_index = table["slopes"][segment]
+        aqi_index *= (concentrations - table["con_lower"][segment])
+        aqi_index += table["aqi_lower"][segment]
+        aqi_index = np.minimum(np.round(aqi_index), table["aqi_upper"][segment])
+        
+        return np.where(valid, aqi_index, 0).astype(int)
+    
+    def get_overall_aqi_nums(self, concentrations: Dict[str, np.ndarray]) -> Tuple[np.ndarray, List[str]]:
+        """Calculate the overall AQI index of each day given the concentration 
+        of several pollutants: the maximum AQI index among the pollutants.
+
+        Args:
+            concentrations (Dict[str, np.ndarray]): Concentrations of each day 
+            by pollutant name.
+
+        Returns:
+            Tuple[np.ndarray, List[str]]: Overall AQI index of each day and the 
+            pollutant responsible for it.
+        """
+        pollutants = list(concentrations.keys())
         
-        return aqi_index
+        # AQI index of each pollutant (rows) for each day (columns)
+        aqi_indexes = np.stack([
+            self.get_pollutant_aqi_nums(pollutant, concentrations[pollutant])
+            for pollutant in pollutants
+        ])
+        
+        dominant = aqi_indexes.argmax(axis=0)
+        return aqi_indexes.max(axis=0), [pollutants[i] for i in dominant]
+    
+    def get_aqi_category_ids(self, aqi_indexes: np.ndarray) -> np.ndarray:
+        """Get the position of the AQI category of many AQI indexes at once.
+        Categories are ordered from Good (0) to Hazardous (5).
+
+        Args:
+            aqi_indexes (np.ndarray): Numerical AQI indexes.
+
+        Returns:
+            np.ndarray: Category of each AQI index.
+        """
+        return np.searchsorted(self.aqi_category_limits, aqi_indexes, side="left")
+    
+    def get_category_probabilities(self, pollutant: str, samples: np.ndarray) -> np.ndarray:
+        """Get the probability of each AQI category from samples of the 
+        concentration of a pollutant, as the share of samples in it.
+
+        Args:
+            pollutant (str): Name of pollutant (o3, pm25, pm10, co, so2, no2)
+            samples (np.ndarray): Concentrations with shape (samples, ...).
+
+        Returns:
+            np.ndarray: Probabilities with shape (..., categories).
+        """
+        category_ids = self.get_aqi_category_ids(self.get_pollutant_aqi_nums(pollutant, samples))
+        categories = np.arange(len(self.aqi_categories))
+        return (category_ids[..., None] == categories).mean(axis=0)
+    
+    def get_category_payload(self, pollutant: str, category_id: int, 
+                             recommendations: bool = False) -> str:
+        """Get the pre-serialized JSON fields of an AQI category: its id, name, 
+        color and, optionally, its recommendations.
+
+        Args:
+            pollutant (str): Name of pollutant (o3, pm25, pm10, co, so2, no2)
+            category_id (int): Category from Good (0) to Hazardous (5).
+            recommendations (bool, optional): Include the recommendations. 
+            Defaults to False.
+
+        Returns:
+            str: JSON object members, without the enclosing braces.
+        """
+        return self.category_payloads[pollutant][recommendations][category_id]
     
     def get_pollutant_aqi_str(self, aqi_index: int) -> Tuple[str,str]:
         """Calculate the AQI index given the concentration of a pollutant.
@@ -83,21 +184,59 @@ class AqiCalculator:
             Tuple[str,str]: Categorical value for the AQI index and Hexadecimal 
             color value.
         """
-        if aqi_index <= 50: 
-            return ("Good", "00E400")
-        elif aqi_index <= 100: 
-            return ("Moderate", "FFFF00")
-        elif aqi_index <= 150: 
-            return ("Unhealthy for Sensitive Groups", "FF7E00")
-        elif aqi_index <= 200: 
-            return ("Unhealthy", "FF0000")
-        elif aqi_index <= 300: 
-            return ("Very Unhealthy", "8F3F97")
-        else: 
-            return ("Hazardous", "7E0023")
+        for category_id, limit in enumerate(self.aqi_category_limits):
+            if aqi_index <= limit:
+                return self.aqi_categories[category_id]
+        return self.aqi_categories[-1]
         
     def get_aqi_recommendations(self, pollutant:str, aqi_cat:str):
         return self.aqi_recommendations[pollutant][aqi_cat]
+    
+    def _initialize_lookup_tables(self) -> None:
+        """ Precompute, for each pollutant, the breakpoint segment of every 
+        concentration bin up to the last breakpoint, and the coefficients of 
+        the AQI equation of each segment. """
+        for pollutant, pollutant_breakpoints in self.breakpoints_table.items():
+            bins_per_unit = round(1 / self.resolutions[pollutant])
+            con_lower, con_upper = np.array(list(pollutant_breakpoints.keys()), dtype=float).T
+            aqi_lower, aqi_upper = np.array(list(pollutant_breakpoints.values()), dtype=float).T
+            
+            # Segment of each bin: the last one starting at or before the bin
+            lower_bins = np.round(con_lower * bins_per_unit).astype(int)
+            segments = np.searchsorted(lower_bins, np.arange(lower_bins[-1] + 1), side="right") - 1
+            slopes = (aqi_upper - aqi_lower) / (con_upper - con_lower)
+            
+            self.lookup_tables[pollutant] = {
+                "bins_per_unit": bins_per_unit,
+                "last_bin": len(segments) - 1,
+                "segments": segments,
+                "slopes": slopes,
+                "con_lower": con_lower,
+                "aqi_lower": aqi_lower,
+                "aqi_upper": aqi_upper,
+                # Python copies for the scalar path
+                "segments_list": segments.tolist(),
+                "slopes_list": slopes.tolist(),
+                "con_lower_list": con_lower.tolist(),
+                "aqi_lower_list": aqi_lower.tolist(),
+                "aqi_upper_list": aqi_upper.astype(int).tolist()
+            }
+    
+    def _initialize_category_payloads(self) -> None:
+        """ Serialize the JSON fields of each AQI category once, with and 
+        without recommendations. """
+        for pollutant in self.breakpoints_table:
+            recommendations = self.aqi_recommendations.get(pollutant, {})
+            payloads = {False: [], True: []}
+            
+            for category_id, (aqi_cat, aqi_color) in enumerate(self.aqi_categories):
+                fields = {"aqi_cat_id": category_id, "aqi_cat": aqi_cat, "aqi_color": aqi_color}
+                payloads[False].append(json.dumps(fields)[1:-1])
+                
+                fields["recommendations"] = recommendations.get(aqi_cat, [])
+                payloads[True].append(json.dumps(fields)[1:-1])
+                
+            self.category_payloads[pollutant] = payloads
         
     def _initialize_recommendations(self):
         asthma_tip = "People with asthma: Follow your asthma action plan and keep quick-relief medicine handy."
@@ -0,0 +1,568 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pymysql
+
+from aqicalculator import AqiCalculator
+from database_manager import DBManager
+from forecaster import PM25Forecaster
+
+# usage: python benchmark.py --output results.json --compare baseline.json
+
+CSV_FILEPATH = Path("semadet-aire-bd.csv")
+MODEL_FILEPATH = Path("models/lstm_seven_step.pkl")
+SCALER_FILEPATH = Path("models/scaler.save")
+FEATURES = ["pm25", "tmp", "rh", "ws", "wd"]
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+SEED = 42
+
+class _SQLiteCursor:
+    """ Cursor wrapper that accepts the pymysql `%s` paramstyle. """
+    def __init__(self, cursor:sqlite3.Cursor):
+        self.cursor = cursor
+
+    def execute(self, query:str, args=None)->None:
+        if args is None:
+            args = ()
+        elif not isinstance(args, (tuple, list)):
+            args = (args,)
+        try:
+            self.cursor.execute(query.replace("%s", "?"), args)
+        except sqlite3.IntegrityError as e:
+            raise pymysql.err.IntegrityError(str(e)) from e
+
+    @property
+    def rowcount(self)->int:
+        return self.cursor.rowcount
+
+    def fetchall(self)->list:
+        return self.cursor.fetchall()
+
+    def close(self)->None:
+        self.cursor.close()
+
+class _SQLiteConnection:
+    """ Connection wrapper exposing the subset of pymysql used by DBManager. """
+    def __init__(self, filepath:str):
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+
+    def cursor(self)->_SQLiteCursor:
+        return _SQLiteCursor(self.connection.cursor())
+
+    def commit(self)->None:
+        self.connection.commit()
+
+    def close(self)->None:
+        # Like MySQL, discard what was not committed, even if a failed
+        # statement is still referenced
+        self.connection.rollback()
+        self.connection.close()
+
+class SQLiteDBManager(DBManager):
+    """
+    DBManager backed by a local SQLite file, used as a MySQL stand-in.
+    """
+    def __init__(self, filepath:str):
+        super().__init__(host=None, port=None, user=None, password=None, db=filepath)
+
+    def _open(self)->None:
+        """Open connection to the SQLite database file"""
+        self.connection = _SQLiteConnection(self.db)
+
+class _StubScraper:
+    """
+    Scraper replacement that returns the last row of the historical data as
+    today's reading, so the API can be measured without Selenium.
+    """
+    def __init__(self, **kwargs):
+        last_row = _load_series()[-1]
+        self.todays_data = {"date": datetime.today().strftime('%Y-%m-%d')}
+        self.todays_data |= dict(zip(FEATURES, map(float, last_row)))
+
+    def get_todays_data(self)->dict:
+        return dict(self.todays_data)
+
+@lru_cache(maxsize=None)
+def _load_series()->np.ndarray:
+    """Load the historical daily readings in chronological order.
+
+    Returns:
+        np.ndarray: Array of shape (days, features).
+    """
+    return pd.read_csv(CSV_FILEPATH)[FEATURES].to_numpy(dtype=float)
+
+def _series_of_length(n_rows:int)->np.ndarray:
+    """Build a series of exactly `n_rows` days by tiling the historical data.
+
+    Args:
+        n_rows (int): Number of days needed.
+
+    Returns:
+        np.ndarray: Array of shape (n_rows, features).
+    """
+    series = _load_series()
+    reps = -(-n_rows // len(series))
+    return np.tile(series, (reps, 1))[:n_rows]
+
+def _create_sqlite_db(filepath:str)->None:
+    """Create the `daily_data` and `pipeline_lock` tables in a SQLite file
+    and load the CSV.
+
+    Args:
+        filepath (str): Path of the SQLite database file.
+    """
+    df = pd.read_csv(CSV_FILEPATH)
+    connection = sqlite3.connect(filepath)
+    connection.execute("""
+        CREATE TABLE daily_data(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE NOT NULL,
+            pm25 FLOAT,
+            o3 FLOAT,
+            pm10 FLOAT,
+            co FLOAT,
+            so2 FLOAT,
+            no2 FLOAT,
+            tmp FLOAT,
+            rh FLOAT,
+            ws FLOAT,
+            wd FLOAT
+        );
+    """)
+    connection.execute("""
+        CREATE TABLE pipeline_lock(
+            name VARCHAR(64) PRIMARY KEY,
+            owner VARCHAR(32) NOT NULL,
+            expires_at DATETIME NOT NULL,
+            completed_at DATETIME
+        );
+    """)
+    connection.executemany(
+        "INSERT INTO daily_data (id, date, pm25, tmp, rh, ws, wd) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        df[["id", "date"] + FEATURES].itertuples(index=False, name=None)
+    )
+    connection.commit()
+    connection.close()
+
+def _time_call(fn:Callable, repeat:int, warmup:int=1, items:int=1)->dict:
+    """Time repeated calls of a function.
+
+    Args:
+        fn (Callable): Function without arguments to measure.
+        repeat (int): Number of measured calls.
+        warmup (int, optional): Number of unmeasured calls. Defaults to 1.
+        items (int, optional): Items processed per call, used for throughput.
+            Defaults to 1.
+
+    Returns:
+        dict: Timing statistics in seconds and items per second.
+    """
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return _summarize(timings, items)
+
+def _summarize(timings:List[float], items:int=1)->dict:
+    """Summarize a list of timings.
+
+    Args:
+        timings (List[float]): Timings in seconds.
+        items (int, optional): Items processed per timing. Defaults to 1.
+
+    Returns:
+        dict: Statistics of the timings.
+    """
+    median = statistics.median(timings)
+    return {
+        "repeat": len(timings),
+        "min": min(timings),
+        "median": median,
+        "mean": statistics.fmean(timings),
+        "p95": float(np.percentile(timings, 95)),
+        "items": items,
+        "items_per_sec": items / median if median else None,
+    }
+
+def bench_forecast(repeat:int)->Dict[str, dict]:
+    """Benchmark `PM25Forecaster.forecast` for several amounts of windows, and
+    `PM25Forecaster.forecast_samples` for several amounts of samples."""
+    model = PM25Forecaster(model_filepath=MODEL_FILEPATH, scaler_filepath=SCALER_FILEPATH)
+    results = {}
+    for batch_size in BATCH_SIZES:
+        data = _series_of_length(batch_size + model.n_dependent)
+        results[f"forecast[windows={batch_size}]"] = _time_call(
+            partial(model.forecast, data), repeat, items=batch_size
+        )
+
+    data = _load_series()[-30:][::-1]
+    for n_samples in (10, 100):
+        results[f"forecast_samples[samples={n_samples}]"] = _time_call(
+            partial(model.forecast_samples, data, n_samples, 0.5), repeat, items=n_samples
+        )
+    return results
+
+def bench_series_to_supervised(repeat:int)->Dict[str, dict]:
+    """Benchmark `PM25Forecaster._series_to_supervised`."""
+    model = PM25Forecaster(model_filepath=MODEL_FILEPATH, scaler_filepath=SCALER_FILEPATH)
+    results = {}
+    for batch_size in BATCH_SIZES:
+        data = model._scale_data(_series_of_length(batch_size + model.n_dependent))
+        results[f"series_to_supervised[windows={batch_size}]"] = _time_call(
+            partial(model._series_to_supervised, data), repeat, items=batch_size
+        )
+    return results
+
+def bench_ensemble(repeat:int)->Dict[str, dict]:
+    """Benchmark `ForecastEnsemble.forecast` against a single model."""
+    from ensemble import ForecastEnsemble
+    import server
+
+    data = _load_series()[-30:][::-1]
+    results = {}
+    for n_models in range(1, len(server.ENSEMBLE_MODELS) + 1):
+        filepaths = dict(list(server.ENSEMBLE_MODELS.items())[:n_models])
+        ensemble = ForecastEnsemble(model_filepaths=filepaths, scaler_filepath=SCALER_FILEPATH)
+        results[f"ensemble[models={n_models}]"] = _time_call(
+            partial(ensemble.forecast, data), repeat, items=n_models
+        )
+    return results
+
+def bench_aqi(repeat:int)->Dict[str, dict]:
+    """Benchmark AQI mapping for a single concentration and in bulk."""
+    aqi_calc = AqiCalculator()
+    rng = np.random.default_rng(SEED)
+    concentrations = rng.uniform(0, 250, size=10000)
+
+    def scalar():
+        aqi_idx = aqi_calc.get_pollutant_aqi_num("pm25", 26.09)
+        aqi_cat, _ = aqi_calc.get_pollutant_aqi_str(aqi_idx)
+        aqi_calc.get_aqi_recommendations("pm25", aqi_cat)
+
+    def bulk():
+        for concentration in concentrations:
+            aqi_idx = aqi_calc.get_pollutant_aqi_num("pm25", concentration)
+            aqi_cat, _ = aqi_calc.get_pollutant_aqi_str(aqi_idx)
+            aqi_calc.get_aqi_recommendations("pm25", aqi_cat)
+
+    def vectorized():
+        aqi_idxs = aqi_calc.get_pollutant_aqi_nums("pm25", concentrations)
+        for category_id in aqi_calc.get_aqi_category_ids(aqi_idxs):
+            aqi_calc.get_category_payload("pm25", category_id)
+
+    return {
+        "aqi[scalar]": _time_call(scalar, repeat * 100),
+        f"aqi[bulk={len(concentrations)}]": _time_call(bulk, repeat, items=len(concentrations)),
+        f"aqi[vectorized={len(concentrations)}]": _time_call(vectorized, repeat, items=len(concentrations)),
+    }
+
+def bench_database(repeat:int, workdir:str)->Dict[str, dict]:
+    """Benchmark `DBManager` round trips against a SQLite stand-in."""
+    filepath = os.path.join(workdir, "bench.sqlite")
+    _create_sqlite_db(filepath)
+    db = SQLiteDBManager(filepath)
+    todays_data = _StubScraper().get_todays_data()
+
+    def upsert():
+        data_id = db.daily_data_exists(todays_data["date"])
+        if data_id:
+            db.update_daily_data(data_id, todays_data)
+        else:
+            db.insert_daily_data(todays_data)
+
+    return {
+        "db[get_last_n_daily_data(30)]": _time_call(partial(db.get_last_n_daily_data, 30), repeat * 10),
+        "db[get_yesterdays_data]": _time_call(db.get_yesterdays_data, repeat * 10),
+        "db[upsert]": _time_call(upsert, repeat * 10),
+    }
+
+def bench_api(repeat:int, workdir:str, concurrency:int, requests:int)->Dict[str, dict]:
+    """Benchmark `/api/v1/forecast` under concurrent load with the scraper
+    stubbed and the database replaced by a SQLite stand-in. The `api` rounds
+    start cold, so they run the whole pipeline: ingestion, database queries
+    and inference. The `api_cached` and `api_conditional` rounds are served
+    from the last good forecast."""
+    from fastapi.testclient import TestClient
+    import server
+
+    filepath = os.path.join(workdir, "bench_api.sqlite")
+    _create_sqlite_db(filepath)
+    server.SemadetScraper = _StubScraper
+    server.DBManager = lambda **kwargs: SQLiteDBManager(filepath)
+    client = TestClient(server.app)
+
+    def reset()->None:
+        # Forget the last good forecasts and today's ingestion, so the next
+        # request scrapes, stores and forecasts again
+        server._last_good.clear()
+        server._ingested_cycle = None
+        with sqlite3.connect(filepath) as connection:
+            connection.execute("DELETE FROM pipeline_lock")
+        connection.close()
+
+    def request(headers:dict=None, status:int=200)->float:
+        start = time.perf_counter()
+        response = client.get("/api/v1/forecast", headers=headers)
+        if response.status_code != status:
+            raise RuntimeError(f"Expected status {status}, got {response.status_code}: {response.text}")
+        return time.perf_counter() - start
+
+    def run(name:str, headers:dict=None, status:int=200, cold:bool=False)->None:
+        latencies, totals = [], []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(repeat):
+                if cold:
+                    reset()
+                start = time.perf_counter()
+                latencies += list(pool.map(lambda _: request(headers, status), range(requests)))
+                totals.append(time.perf_counter() - start)
+
+        results[f"{name}[concurrency={concurrency}].latency"] = _summarize(latencies)
+        results[f"{name}[concurrency={concurrency}].throughput"] = _summarize(totals, items=requests)
+
+    results = {}
+    request()
+    run("api", cold=True)
+    run("api_cached")
+    # Polling clients send back the ETag of their last response
+    etag = client.get("/api/v1/forecast").headers["ETag"]
+    run("api_conditional", {"If-None-Match": etag}, 304)
+    return results
+
+def create_sqlite_app():
+    """Create the API with the scraper stubbed and the SQLite database of the
+    `BENCHMARK_SQLITE` environment variable, for `serve.py --factory`."""
+    _use_example_config()
+    import server
+
+    filepath = os.environ["BENCHMARK_SQLITE"]
+    server.SemadetScraper = _StubScraper
+    server.DBManager = lambda **kwargs: SQLiteDBManager(filepath)
+    return server.app
+
+def _process_memory(pid:int)->Tuple[float, float]:
+    """Get the resident and proportional set size of a process and its
+    children, in MB. Pages shared by several processes count fully in the
+    RSS of each one, and are split among them in the PSS.
+
+    Args:
+        pid (int): Process id of the parent.
+
+    Returns:
+        Tuple[float, float]: Total RSS and PSS.
+    """
+    children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    rss = pss = 0
+    for process in [pid] + [int(child) for child in children]:
+        for line in Path(f"/proc/{process}/smaps_rollup").read_text().splitlines():
+            if line.startswith("Rss:"):
+                rss += int(line.split()[1])
+            elif line.startswith("Pss:"):
+                pss += int(line.split()[1])
+    return rss / 1024, pss / 1024
+
+def bench_serving(repeat:int, workdir:str, concurrency:int, requests:int,
+                  workers:int)->Tuple[Dict[str, dict], Dict[str, dict]]:
+    """Benchmark `serve.py` with several workers and each model runtime: the
+    Keras models loaded by every worker, and the NumPy exports loaded once
+    and shared with the workers. Each request forecasts 30 past dates with
+    `/api/v1/forecast/batch`.
+
+    Returns:
+        Tuple[Dict[str, dict], Dict[str, dict]]: Timings, and startup time
+        and memory of each runtime.
+    """
+    filepath = os.path.join(workdir, "bench_serving.sqlite")
+    _create_sqlite_db(filepath)
+    payload = json.dumps({"start_date": "2023-12-01", "end_date": "2023-12-30"}).encode()
+
+    results, memory = {}, {}
+    for runtime in ["keras", "numpy"]:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        url = f"http://127.0.0.1:{port}"
+
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "serve.py", "--app", "benchmark:create_sqlite_app", "--factory",
+             "--port", str(port), "--workers", str(workers), "--runtime", runtime],
+            env=os.environ | {"BENCHMARK_SQLITE": filepath},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+        def request()->float:
+            request_start = time.perf_counter()
+            with urllib.request.urlopen(urllib.request.Request(
+                    f"{url}/api/v1/forecast/batch", data=payload,
+                    headers={"Content-Type": "application/json"})) as response:
+                response.read()
+            return time.perf_counter() - request_start
+
+        try:
+            # Ready once a forecast can be served, models included
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"serve.py exited with status {process.returncode}")
+                try:
+                    request()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            startup = time.perf_counter() - start
+
+            # Let every worker load its models
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(lambda _: request(), range(4 * workers)))
+
+            latencies, totals = [], []
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for _ in range(repeat):
+                    round_start = time.perf_counter()
+                    latencies += list(pool.map(lambda _: request(), range(requests)))
+                    totals.append(time.perf_counter() - round_start)
+
+            rss, pss = _process_memory(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+
+        name = f"serving[runtime={runtime},workers={workers}]"
+        results[f"{name}.latency"] = _summarize(latencies)
+        results[f"{name}.throughput"] = _summarize(totals, items=requests)
+        memory[name] = {"startup_s": startup, "rss_mb": rss, "pss_mb": pss}
+
+    return results, memory
+
+def _use_example_config()->None:
+    """Let the API be imported without a `config.py`, it only needs the
+    credentials module to exist."""
+    try:
+        import config
+    except ImportError:
+        import config_example
+        sys.modules["config"] = config_example
+
+def _metadata()->dict:
+    """Describe the environment where the benchmark ran."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "cpu_count": os.cpu_count(),
+    }
+
+def compare(results:dict, baseline:dict, threshold:float)->List[str]:
+    """Compare the median timings of two benchmark runs.
+
+    Args:
+        results (dict): Results of the current run.
+        baseline (dict): Results of a previous run.
+        threshold (float): Allowed relative slowdown before flagging (0.1 = 10%).
+
+    Returns:
+        List[str]: Description of every benchmark that regressed.
+    """
+    regressions = []
+    for name, stats in results["results"].items():
+        previous = baseline["results"].get(name)
+        if not previous or not previous["median"]:
+            continue
+        change = stats["median"] / previous["median"] - 1
+        if change > threshold:
+            regressions.append(
+                f"{name}: {previous['median']:.6f}s -> {stats['median']:.6f}s (+{change:.1%})"
+            )
+    return regressions
+
+SUITES = ["forecast", "supervised", "ensemble", "aqi", "db", "api", "serving"]
+
+def main()->int:
+    parser = argparse.ArgumentParser(description="Benchmark the PM2.5 forecast pipeline.")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES,
+                        help="Benchmarks to run.")
+    parser.add_argument("--repeat", type=int, default=5, help="Measured calls per benchmark.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent API clients.")
+    parser.add_argument("--requests", type=int, default=32, help="API requests per round.")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes of the serving benchmark.")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results.")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown flagged as a regression.")
+    args = parser.parse_args()
+
+    np.random.seed(SEED)
+    _use_example_config()
+    results = {"metadata": _metadata(), "results": {}, "memory": {}}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if "forecast" in args.suites:
+            results["results"] |= bench_forecast(args.repeat)
+        if "supervised" in args.suites:
+            results["results"] |= bench_series_to_supervised(args.repeat)
+        if "ensemble" in args.suites:
+            results["results"] |= bench_ensemble(args.repeat)
+        if "aqi" in args.suites:
+            results["results"] |= bench_aqi(args.repeat)
+        if "db" in args.suites:
+            results["results"] |= bench_database(args.repeat, workdir)
+        if "api" in args.suites:
+            results["results"] |= bench_api(args.repeat, workdir, args.concurrency, args.requests)
+        if "serving" in args.suites:
+            timings, memory = bench_serving(args.repeat, workdir, args.concurrency,
+                                            args.requests, args.workers)
+            results["results"] |= timings
+            results["memory"] |= memory
+
+    for name, stats in results["results"].items():
+        print(f"{name:<50} median {stats['median']:.6f}s  p95 {stats['p95']:.6f}s")
+    for name, stats in results["memory"].items():
+        print(f"{name:<50} startup {stats['startup_s']:.1f}s  RSS {stats['rss_mb']:.0f}MB  PSS {stats['pss_mb']:.0f}MB")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,4 +2,6 @@ host = "localhost"
 port = 3306
 user = "user"
 password = "password"
-db = "database"
\ No newline at end of file
+db = "database"
+# Runtime of the models: "keras" or "numpy" (exports of numpy_runtime.py)
+model_runtime = "keras"
\ No newline at end of file
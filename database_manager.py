@@ -1,5 +1,6 @@
 import pymysql
 import numpy as np
+from datetime import datetime, timedelta
 
 class DBManager:
     """
@@ -11,6 +12,9 @@ class DBManager:
         self.user = user
         self.password = password
         self.db = db
+        # Pollutant columns of the daily_data table
+        self.pollutants = ["pm25", "o3", "pm10", "co", "so2", "no2"]
+        self.meteorological = ["tmp", "rh", "ws", "wd"]
     
     def _open(self)->None:
         """Open connection to database"""
@@ -24,21 +28,29 @@ class DBManager:
         """Close connection to database"""
         self.connection.close()
         
-    def get_last_n_daily_data(self, n:int)->tuple:
+    def get_last_n_daily_data(self, n:int, pollutants:list=None)->tuple:
         """Retrieve data for last n days. It includes daily readings for PM25, 
         temperature, relative, humidity, wind speed and wind direction (in this
         order).
         
         Args:
             n (int): Number of past days to retrieve.
+            pollutants (list, optional): Pollutants to retrieve instead of 
+            PM25, in this order before the meteorological readings.
 
         Returns:
             tuple: A tuple with nested entries for each daily data.
         """
+        pollutants = pollutants or ["pm25"]
+        unknown = set(pollutants) - set(self.pollutants)
+        if unknown:
+            raise ValueError(f"Unknown pollutants: {sorted(unknown)}")
+        columns = ", ".join(f"d.{column}" for column in pollutants + self.meteorological)
+        
         self._open()
         cursor = self.connection.cursor()
         query = f""" 
-            SELECT d.pm25, d.tmp, d.rh, d.ws, d.wd 
+            SELECT {columns} 
             FROM daily_data d
             ORDER BY id DESC
             LIMIT {n};
@@ -49,18 +61,51 @@ class DBManager:
         self._close()
         return np.asarray(result)
     
+    def get_daily_data_range(self, start_date:str, end_date:str)->tuple:
+        """Retrieve data between two dates (YYYY-MM-DD), both inclusive, in
+        chronological order. It includes daily readings for PM25, temperature,
+        relative humidity, wind speed and wind direction (in this order).
+
+        Args:
+            start_date (str): First date to retrieve.
+            end_date (str): Last date to retrieve.
+
+        Returns:
+            tuple: A list with the date of each entry and an array with the
+            daily data of each entry.
+        """
+        self._open()
+        cursor = self.connection.cursor()
+        query = """
+            SELECT d.date, d.pm25, d.tmp, d.rh, d.ws, d.wd
+            FROM daily_data d
+            WHERE d.date BETWEEN %s AND %s
+            ORDER BY d.date ASC;
+        """
+        cursor.execute(query, (start_date, end_date))
+        result = cursor.fetchall()
+        cursor.close()
+        self._close()
+
+        dates = [str(row[0]) for row in result]
+        data = np.asarray([row[1:] for row in result], dtype=float)
+        return dates, data
+
     def get_yesterdays_data(self)->dict:
         """Retrieve the previous day's daily data as a dictionary. It includes 
-        daily readings for PM25, temperature, relative, humidity, wind speed and
-        wind direction (in this order).
+        daily readings for every pollutant, temperature, relative, humidity, 
+        wind speed and wind direction. Missing readings are None.
 
         Returns:
-            dict: Dictionary with keys for pm25, tmp, rh, ws, and wd.
+            dict: Dictionary with keys for pm25, o3, pm10, co, so2, no2, tmp, 
+            rh, ws, and wd.
         """
+        columns = self.pollutants + self.meteorological
+        
         self._open()
         cursor = self.connection.cursor()
         query = f""" 
-            SELECT d.pm25, d.tmp, d.rh, d.ws, d.wd 
+            SELECT {", ".join(f"d.{column}" for column in columns)} 
             FROM daily_data d
             ORDER BY id DESC
             LIMIT 1;
@@ -70,13 +115,9 @@ class DBManager:
         cursor.close()
         self._close()
         
-        result = np.asarray(result).flatten()
         data = {
-            "pm25": float(result[0]), 
-            "tmp": float(result[1]), 
-            "rh": float(result[2]), 
-            "ws": float(result[3]),
-            "wd": float(result[4])
+            column: None if value is None else float(value)
+            for column, value in zip(columns, result[0])
         }
         return data
     
@@ -108,61 +149,154 @@ class DBManager:
     def update_daily_data(self, data_id: int, data:dict)->None:
         """Updates a daily data entry in the database. The entry information 
         must include date (YYYY-MM-DD), PM25, temperature, relative humidity, 
-        wind speed and wind direction.
+        wind speed and wind direction, and may include the other pollutants.
 
         Args:
-            data (dict): Dictionary with keys for date, pm25, tmp, rh, ws, and wd.
+            data (dict): Dictionary with keys for date, pm25, tmp, rh, ws, and 
+            wd, and optionally o3, pm10, co, so2 and no2.
+
+        Raises:
+            Exception: The error of the database if the entry could not be 
+            updated.
         """
+        columns = self.pollutants + self.meteorological
         try:
             self._open()
             cursor = self.connection.cursor()
-            query = """
+            query = f"""
                 UPDATE daily_data 
-                SET pm25 = %s, tmp = %s, rh = %s, ws = %s, wd = %s
+                SET {", ".join(f"{column} = %s" for column in columns)}
                 WHERE id = %s;
             """
-            cursor.execute(query, (
-                data["pm25"],
-                data["tmp"],
-                data["rh"],
-                data["ws"],
-                data["wd"],
-                data_id
-            ))
+            cursor.execute(query, tuple(data.get(column) for column in columns) + (data_id,))
             self.connection.commit()
         except Exception as e:
             print(f"Error updating daily data: {e}")
+            raise
         finally:
             self._close()
     
     def insert_daily_data(self, data:dict)->None:
         """Inserts a daily data entry to the database. This entry must include 
         information for the date (YYYY-MM-DD), PM25, temperature, 
-        relative humidity, wind speed and wind direction.
+        relative humidity, wind speed and wind direction, and may include the 
+        other pollutants.
 
         Args:
-            data (dict): Dictionary with keys for pm25, tmp, rh, ws, and wd.
+            data (dict): Dictionary with keys for pm25, tmp, rh, ws, and wd, 
+            and optionally o3, pm10, co, so2 and no2.
+
+        Raises:
+            Exception: The error of the database if the entry could not be 
+            inserted.
         """
+        columns = ["date"] + self.pollutants + self.meteorological
         try:
             self._open()
             cursor = self.connection.cursor()
-            query = """
-                INSERT INTO daily_data (date, pm25, tmp, rh, ws, wd)
-                VALUES (%s, %s, %s, %s, %s, %s)
+            query = f"""
+                INSERT INTO daily_data ({", ".join(columns)})
+                VALUES ({", ".join(["%s"] * len(columns))})
             """
-            cursor.execute(query, (
-                data["date"],
-                data["pm25"],
-                data["tmp"],
-                data["rh"],
-                data["ws"],
-                data["wd"]
-            ))
+            cursor.execute(query, tuple(data.get(column) for column in columns))
             self.connection.commit()
         except Exception as e:
             print(f"Error inserting daily data: {e}")
+            raise
         finally:
             self._close()
+
+    def acquire_lock(self, name:str, owner:str, ttl:int)->bool:
+        """Try to take a named lock shared by every process using the 
+        database. A lock that was not completed before expiring can be taken 
+        by another owner.
+
+        Args:
+            name (str): Name of the lock.
+            owner (str): Unique identifier of who takes the lock.
+            ttl (int): Seconds after which the lock expires.
+
+        Returns:
+            bool: True if the lock was taken, False if someone else has it or 
+            it was already completed.
+        """
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=ttl)
         
+        self._open()
+        cursor = self.connection.cursor()
+        try:
+            query = """
+                INSERT INTO pipeline_lock (name, owner, expires_at) 
+                VALUES (%s, %s, %s)
+            """
+            cursor.execute(query, (name, owner, expires_at))
+            acquired = True
+        except pymysql.err.IntegrityError:
+            # Take the lock only if its owner did not complete it in time
+            query = """
+                UPDATE pipeline_lock 
+                SET owner = %s, expires_at = %s 
+                WHERE name = %s AND completed_at IS NULL AND expires_at < %s;
+            """
+            cursor.execute(query, (owner, expires_at, name, now))
+            acquired = cursor.rowcount == 1
+        self.connection.commit()
+        cursor.close()
+        self._close()
+        return acquired
+    
+    def release_lock(self, name:str, owner:str, completed:bool)->None:
+        """Release a named lock taken with `acquire_lock`. A completed lock 
+        is kept so nobody repeats the work; otherwise it is deleted so 
+        another owner can retry it. Completed locks older than a day are 
+        removed.
+
+        Args:
+            name (str): Name of the lock.
+            owner (str): Identifier used to take the lock.
+            completed (bool): Whether the work protected by the lock was done.
+        """
+        now = datetime.now()
+        
+        self._open()
+        cursor = self.connection.cursor()
+        if completed:
+            query = """
+                UPDATE pipeline_lock SET completed_at = %s 
+                WHERE name = %s AND owner = %s;
+            """
+            cursor.execute(query, (now, name, owner))
+            query = """
+                DELETE FROM pipeline_lock WHERE completed_at < %s;
+            """
+            cursor.execute(query, (now - timedelta(days=1)))
+        else:
+            query = """
+                DELETE FROM pipeline_lock WHERE name = %s AND owner = %s;
+            """
+            cursor.execute(query, (name, owner))
+        self.connection.commit()
+        cursor.close()
+        self._close()
+    
+    def lock_completed(self, name:str)->bool:
+        """Check if the work protected by a named lock was completed.
+
+        Args:
+            name (str): Name of the lock.
+
+        Returns:
+            bool: True if the lock was released as completed.
+        """
+        self._open()
+        cursor = self.connection.cursor()
+        query = """
+            SELECT l.completed_at FROM pipeline_lock l WHERE l.name = %s
+        """
+        cursor.execute(query, (name))
+        result = cursor.fetchall()
+        cursor.close()
+        self._close()
         
-        
\ No newline at end of file
+        return len(result) > 0 and result[0][0] is not None
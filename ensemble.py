@@ -0,0 +1,255 @@
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from forecaster import PM25Forecaster, fuse_models
+from numpy_runtime import NumpyModelGroup
+
+def _add_latency(counter:dict, latency:float)->None:
+    """Add a call and its duration in seconds to a latency counter."""
+    counter["calls"] += 1
+    counter["latency_total"] += latency
+    counter["latency_max"] = max(counter["latency_max"], latency)
+
+def _latency_summary(counter:dict)->dict:
+    """Get the calls, mean and maximum latency of a latency counter."""
+    calls = counter["calls"]
+    return {
+        "calls": calls,
+        "latency_mean": counter["latency_total"] / calls if calls else None,
+        "latency_max": counter["latency_max"] if calls else None
+    }
+
+class ModelStats:
+    """
+    Thread-safe latency and accuracy counters for each served model, and the
+    latency of the inference calls that run all of them.
+    """
+    def __init__(self, model_names:List[str]):
+        self.lock = threading.Lock()
+        self.counters = {
+            name: {
+                "calls": 0,
+                "latency_total": 0.0,
+                "latency_max": 0.0,
+                "errors": 0,
+                "abs_error_total": 0.0,
+                "squared_error_total": 0.0
+            }
+            for name in model_names
+        }
+        self.call_counter = {"calls": 0, "latency_total": 0.0, "latency_max": 0.0}
+        # Latest forecast of each model waiting for the real value:
+        # {date: {model: value}}
+        self.pending = defaultdict(dict)
+
+    def record_call(self, latency:float)->None:
+        """Record an inference call that ran every model.
+
+        Args:
+            latency (float): Duration of the call in seconds.
+        """
+        with self.lock:
+            _add_latency(self.call_counter, latency)
+
+    def record_latency(self, latencies:Dict[str, float])->None:
+        """Record the time each model took within an inference call.
+
+        Args:
+            latencies (Dict[str, float]): Seconds taken by each model.
+        """
+        with self.lock:
+            for name, latency in latencies.items():
+                _add_latency(self.counters[name], latency)
+
+    def record_forecast(self, model_name:str, dates:List[str], values:np.ndarray)->None:
+        """Keep the forecast of a model to compare it once the real values of
+        the forecasted dates (YYYY-MM-DD) are known. A new forecast of a date
+        replaces the previous one of the model, so each model is scored once
+        per date however many times it forecasts it.
+
+        Args:
+            model_name (str): Model that made the forecast.
+            dates (List[str]): Date of each forecasted value.
+            values (np.ndarray): Forecasted values.
+        """
+        with self.lock:
+            for date, value in zip(dates, values):
+                self.pending[date][model_name] = float(value)
+
+    def pending_dates(self)->List[str]:
+        """Dates (YYYY-MM-DD) with forecasts waiting for their real value."""
+        with self.lock:
+            return sorted(self.pending.keys())
+
+    def record_observations(self, dates:List[str], values:np.ndarray)->None:
+        """Compare the pending forecasts of the given dates with their real
+        values and update the accuracy counters.
+
+        Args:
+            dates (List[str]): Dates (YYYY-MM-DD) of the real values.
+            values (np.ndarray): Real values.
+        """
+        with self.lock:
+            for date, value in zip(dates, values):
+                for name, forecast in self.pending.pop(date, {}).items():
+                    error = forecast - value
+                    counter = self.counters[name]
+                    counter["errors"] += 1
+                    counter["abs_error_total"] += abs(error)
+                    counter["squared_error_total"] += error ** 2
+
+    def discard_pending(self, before:str)->None:
+        """Forget the pending forecasts of dates (YYYY-MM-DD) before a given
+        date, i.e. dates whose real value will never be available.
+
+        Args:
+            before (str): First date to keep.
+        """
+        with self.lock:
+            for date in [date for date in self.pending if date < before]:
+                del self.pending[date]
+
+    def call_summary(self)->dict:
+        """Get the mean latency of the inference calls that run every model.
+
+        Returns:
+            dict: Calls, mean and maximum latency in seconds.
+        """
+        with self.lock:
+            return _latency_summary(self.call_counter)
+
+    def summary(self)->Dict[str, dict]:
+        """Get the mean latency, MAE and RMSE of each model. The latency of 
+        each model is measured when the models run one after another (NumPy 
+        runtime). A fused Keras graph runs them together, so each model gets 
+        a share of the latency of the call, proportional to its input days.
+
+        Returns:
+            Dict[str, dict]: Counters and derived metrics of each model.
+        """
+        with self.lock:
+            summary = {}
+            for name, counter in self.counters.items():
+                errors = counter["errors"]
+                summary[name] = _latency_summary(counter) | {
+                    "errors": errors,
+                    "mae": counter["abs_error_total"] / errors if errors else None,
+                    "rmse": (counter["squared_error_total"] / errors) ** 0.5 if errors else None
+                }
+            return summary
+
+class ForecastEnsemble:
+    """
+    Serve several LSTM models with a single inference call. The models are
+    fused into one Keras graph that receives the windows of every model, so
+    adding a model costs much less than an extra `predict`. Models exported
+    for the NumPy runtime run one after another instead, so their cost grows
+    linearly with the number of models. The results can be combined into an
+    ensemble or used for an A/B test.
+    """
+    def __init__(self, model_filepaths:Dict[str,str], scaler_filepath:str,
+                 weights:Dict[str,float]=None):
+        """Initialize the ensemble with the filepaths to each LSTM model and
+        the MinMaxScaler model shared by all of them.
+
+        Args:
+            model_filepaths (Dict[str,str]): Filepath to each model by name.
+            scaler_filepath (str): Filepath to data scaler.
+            weights (Dict[str,float], optional): Weight of each model for the
+            ensemble mean and the A/B traffic split. Defaults to equal weights.
+        """
+        self.members = {
+            name: PM25Forecaster(model_filepath=filepath, scaler_filepath=scaler_filepath)
+            for name, filepath in model_filepaths.items()
+        }
+        self.names = list(self.members.keys())
+        self.n_pred = self.members[self.names[0]].n_pred
+
+        # Models must predict either one day per window or all the days at once
+        for name, member in self.members.items():
+            horizon = member.model.output_shape[-1]
+            if horizon not in (1, self.n_pred):
+                raise ValueError(f"Model {name} predicts {horizon} days, expected 1 or {self.n_pred}")
+
+        weights = weights or {name: 1.0 for name in self.names}
+        total = sum(weights[name] for name in self.names)
+        self.weights = np.array([weights[name] / total for name in self.names])
+
+        # Single graph running every model on its own input
+        self.model = fuse_models([member.model for member in self.members.values()])
+
+        # A fused Keras graph runs every model at once, its latency is split
+        # among them by their input days: the recurrent steps of a model run
+        # one after another and take most of its time
+        days = np.array([member.n_dependent for member in self.members.values()], dtype=float)
+        self.latency_shares = days / days.sum()
+
+        self.stats = ModelStats(self.names)
+
+    def forecast(self, data:np.ndarray)->Dict[str, np.ndarray]:
+        """Forecast PM2.5 values 7 days ahead with every model. The data has
+        the same format as for `PM25Forecaster.forecast`.
+
+        Args:
+            data (np.ndarray): Data for prediction.
+
+        Returns:
+            Dict[str, np.ndarray]: 7 day prediction of each model.
+        """
+        inputs = [member._create_forecast_input(data) for member in self.members.values()]
+
+        # Run all models, timing each one when they run one after another
+        # and splitting the latency of a fused call otherwise
+        start = time.perf_counter()
+        if isinstance(self.model, NumpyModelGroup):
+            outputs, latencies = self.model.predict_timed(inputs)
+            latency = time.perf_counter() - start
+        else:
+            outputs = self.model.predict(inputs, verbose=0)
+            if len(self.names) == 1:
+                outputs = [outputs]
+            latency = time.perf_counter() - start
+            latencies = latency * self.latency_shares
+        self.stats.record_latency(dict(zip(self.names, map(float, latencies))))
+        self.stats.record_call(latency)
+
+        return {
+            name: self.members[name]._read_forecast_output(yhat)
+            for name, yhat in zip(self.names, outputs)
+        }
+
+    def combine(self, predictions:Dict[str, np.ndarray])->Dict[str, np.ndarray]:
+        """Combine the predictions of every model into a weighted mean and its
+        spread.
+
+        Args:
+            predictions (Dict[str, np.ndarray]): Prediction of each model.
+
+        Returns:
+            Dict[str, np.ndarray]: Mean, standard deviation, minimum and
+            maximum of each day.
+        """
+        values = np.stack([predictions[name] for name in self.names])
+        mean = self.weights @ values
+        std = np.sqrt(self.weights @ (values - mean) ** 2)
+        return {"mean": mean, "std": std, "min": values.min(axis=0), "max": values.max(axis=0)}
+
+    def assign(self, client_id:str)->str:
+        """Assign a client to a model following the traffic split given by the
+        weights. The same client always gets the same model.
+
+        Args:
+            client_id (str): Identifier of the client.
+
+        Returns:
+            str: Name of the assigned model.
+        """
+        digest = hashlib.sha256(client_id.encode()).digest()
+        bucket = int.from_bytes(digest[:8], "big") / 2**64
+        idx = int(np.searchsorted(np.cumsum(self.weights), bucket, side="right"))
+        return self.names[min(idx, len(self.names) - 1)]
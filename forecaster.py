@@ -1,40 +1,135 @@
 import joblib # Save model
+import threading
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from pathlib import Path
+from typing import Dict, Tuple
 
-class PM25Forecaster:
+import numpy_runtime
+
+# Meteorological features used by every model, after the pollutant
+METEOROLOGICAL_FEATURES = ["tmp", "rh", "ws", "wd"]
+# Largest work buffer kept between calls by each thread, in elements (4 MB
+# of float64), bigger arrays are allocated per call and freed after it
+MAX_BUFFER_SIZE = 2 ** 19
+
+def load_model(filepath:str):
+    """Load a pickled model or scaler, or one exported by `numpy_runtime`. 
+    Exported models run without TensorFlow, which is only imported when a 
+    pickled Keras model is loaded.
+
+    Args:
+        filepath (str): Filepath to the pickle or directory of the export.
+
+    Returns:
+        Loaded model or scaler.
     """
-    LSTM model for forecasting 7-day PM2.5 values based on the previous 23 days.
+    if Path(filepath).is_dir():
+        return numpy_runtime.load(filepath)
+    return joblib.load(filepath)
+
+def fuse_models(models:list):
+    """Join several Keras models into a single graph with one input and one 
+    output per model, so all of them run with a single `predict` call.
+
+    Args:
+        models (list): Keras models, or models exported by `numpy_runtime`.
+
+    Returns:
+        keras.Model: Model receiving a list with the input of each model.
     """
-    def __init__(self, model_filepath:str, scaler_filepath:str):
-        """Initialize PM25 Forecaster with filepaths to the LTSM model and 
-        MinMaxScaler model.
+    if all(isinstance(model, numpy_runtime.NumpySequential) for model in models):
+        return numpy_runtime.NumpyModelGroup(models)
+    
+    import keras
+    
+    # Models loaded from the same training run share their name
+    names = set()
+    for i, model in enumerate(models):
+        if model.name in names:
+            model.name = f"{model.name}_{i}"
+        names.add(model.name)
+    
+    inputs = [keras.Input(shape=model.input_shape[1:]) for model in models]
+    outputs = [model(x) for model, x in zip(models, inputs)]
+    return keras.Model(inputs, outputs)
+
+class PollutantForecaster:
+    """
+    LSTM model for forecasting 7-day values of a pollutant based on the 
+    previous days of the pollutant and the meteorological data.
+    """
+    def __init__(self, model_filepath:str, scaler_filepath:str, pollutant:str):
+        """Initialize Pollutant Forecaster with filepaths to the LTSM model and 
+        MinMaxScaler model, either pickled or exported by `numpy_runtime`.
 
         Args:
             model_filename (str): Filepath to model.
             scaler_filename (str): Filepath to data scaler.
+            pollutant (str): Name of pollutant (o3, pm25, pm10, co, so2, no2)
         """
-        self.model = joblib.load(model_filepath) 
-        self.scaler = joblib.load(scaler_filepath)
+        self.model = load_model(model_filepath) 
+        self.scaler = load_model(scaler_filepath)
         
         self.n_pred = 7
-        self.n_dependent = 23
-        self.features = ["pm25", "tmp", "rh", "ws", "wd"] 
+        # Days used by the model for each prediction (23 for the 7-day model)
+        self.n_dependent = self.model.input_shape[1]
+        self.features = [pollutant] + METEOROLOGICAL_FEATURES
         self.n_features = len(self.features)
-        self.pollutant = "pm25"
+        self.pollutant = pollutant
         self.pollutant_idx = 0
         
-    def _scale_data(self, data:np.ndarray)->np.ndarray:
-        """ Scale data to [0, 1] range using pre-fitted scaler.
+        # Parameters of the MinMaxScaler, applied directly with NumPy
+        self.scale_min = np.asarray(self.scaler.min_, dtype=float)
+        self.scale = np.asarray(self.scaler.scale_, dtype=float)
+        
+        # Reusable work buffers of the batched path, one set per thread
+        self._buffers = threading.local()
+        
+    def _buffer(self, name:str, shape:tuple, dtype=float)->np.ndarray:
+        """Get a preallocated work array of the current thread. The array is 
+        only reallocated when a bigger one is needed, so its contents are 
+        overwritten by the next call with the same name. Arrays bigger than 
+        `MAX_BUFFER_SIZE` are not kept, so threads do not hold on to the 
+        memory of an occasional large batch.
+
+        Args:
+            name (str): Name of the buffer.
+            shape (tuple): Shape of the needed array.
+            dtype (optional): Data type of the array. Defaults to float64.
+
+        Returns:
+            np.ndarray: Uninitialized array with the given shape.
+        """
+        size = int(np.prod(shape))
+        if size > MAX_BUFFER_SIZE:
+            return np.empty(shape, dtype=dtype)
+        
+        buffer = getattr(self._buffers, name, None)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = np.empty(size, dtype=dtype)
+            setattr(self._buffers, name, buffer)
+        return buffer[:size].reshape(shape)
+    
+    def _scale_data(self, data:np.ndarray, out:np.ndarray=None)->np.ndarray:
+        """ Scale data to [0, 1] range using the pre-fitted scaler parameters.
 
         Args:
-            data (pd.DataFrame): Data to forecast.
+            data (np.ndarray): Data to forecast.
+            out (np.ndarray, optional): Array to write the result to. A new 
+            array is allocated if not given.
 
         Returns:
-            pd.DataFrame: Scaled data.
+            np.ndarray: Scaled data.
         """
-        # Scale the information in each column
-        return self.scaler.transform(data)
+        if out is None:
+            out = np.empty(np.shape(data))
+        
+        # Scale the information in each column (same as scaler.transform)
+        np.multiply(data, self.scale, out=out)
+        np.add(out, self.scale_min, out=out)
+        return out
     
     def _series_to_supervised(self, data:np.ndarray)->pd.DataFrame:
         """Convert time series data into supervised learning format.
@@ -82,32 +177,60 @@ class PM25Forecaster:
         # Reshape each set
         return values.reshape(data.shape[0], self.n_dependent, self.n_features)
     
-    def _inverse_scale(self, yhat:np.ndarray)->np.ndarray:
-        """ Inverse-transform the scaled PM2.5 predictions.
+    def _create_windows(self, data:np.ndarray)->np.ndarray:
+        """Build the LSTM input windows of one or several series in a single 
+        vectorized pass. For each series it is equivalent to calling 
+        `_create_X_set` on the output of `_series_to_supervised`.
 
         Args:
-            yhat (np.ndarray): Predicted values by LTSM.
+            data (np.ndarray): Scaled data with shape (..., days, features).
 
         Returns:
-            np.ndarray: Real predicted values.
+            np.ndarray: Windows with shape 
+            (..., days - `n_dependent`, `n_dependent`, `n_features`).
         """
-        n_samples = yhat.shape[1]
-        
-        # Placeholder for full features needed by scaler
-        dummy = np.zeros((n_samples * self.n_pred, self.n_features))
+        # View of every run of n_dependent consecutive days
+        windows = sliding_window_view(data, self.n_dependent, axis=-2)
+        # Order as (time_steps, features)
+        windows = np.swapaxes(windows, -1, -2)
+        # The last window has no day left to predict
+        return windows[..., :-1, :, :]
+    
+    def _create_input_windows(self, data:np.ndarray)->np.ndarray:
+        """Build the model input windows of data with the newest day first, 
+        like `get_last_n_daily_data`. The days of each window are put back in 
+        chronological order, the order the models were trained with.
 
-        # Flatten yhat to 1D, and place it into dummy
-        dummy[:, self.pollutant_idx] = yhat.reshape(-1)
+        Args:
+            data (np.ndarray): Scaled data with shape (..., days, features), 
+            newest day first.
+
+        Returns:
+            np.ndarray: Windows with the same shape as `_create_windows`.
+        """
+        return self._create_windows(data)[..., ::-1, :]
+    
+    def _inverse_scale(self, yhat:np.ndarray, out:np.ndarray=None)->np.ndarray:
+        """ Inverse-transform the scaled pollutant predictions.
 
-        # Inverse transform
-        inv_feat = self.scaler.inverse_transform(dummy)
+        Args:
+            yhat (np.ndarray): Predicted values by LTSM.
+            out (np.ndarray, optional): Flat array to write the result to. A 
+            new array is allocated if not given.
 
-        # Extract only the feature from the result
-        inv_feat = inv_feat[:, self.pollutant_idx]
+        Returns:
+            np.ndarray: Real predicted values.
+        """
+        # One prediction per window
+        inv_feat = np.empty(yhat.size) if out is None else out
+        
+        # Inverse transform only the pollutant (same as scaler.inverse_transform)
+        np.subtract(yhat.reshape(-1), self.scale_min[self.pollutant_idx], out=inv_feat)
+        np.divide(inv_feat, self.scale[self.pollutant_idx], out=inv_feat)
         return inv_feat
     
     def _predict(self, X:np.ndarray)->np.ndarray:
-        """Predict PM2.5 using the LSTM model.
+        """Predict the pollutant using the LSTM model.
 
         Args:
             X (np.ndarray): Reshaped data for LTSM.
@@ -119,16 +242,46 @@ class PM25Forecaster:
         yhat = self.model.predict(X, verbose=0)
         return yhat
     
+    def _create_forecast_input(self, data:np.ndarray)->np.ndarray:
+        """Build the model input of a 7-day forecast: the `n_pred` windows 
+        with the newest days, whatever the number of days used by the model. 
+        The data has the newest day first, like `get_last_n_daily_data`, so 
+        these are its first windows.
+
+        Args:
+            data (np.ndarray): Data for prediction, newest day first.
+
+        Returns:
+            np.ndarray: Input windows for the model.
+        """
+        windows = self._create_input_windows(self._scale_data(data))
+        return np.ascontiguousarray(windows[:self.n_pred])
+    
+    def _read_forecast_output(self, yhat:np.ndarray)->np.ndarray:
+        """Get the 7-day forecast from the model output for the input of 
+        `_create_forecast_input`. Models predicting one day per window give 
+        a day for each window, models predicting 7 days use the window with 
+        the newest days.
+
+        Args:
+            yhat (np.ndarray): Predicted values by LTSM.
+
+        Returns:
+            np.ndarray: 7 day prediction for the pollutant.
+        """
+        yhat = yhat[:, 0] if yhat.shape[-1] == 1 else yhat[0]
+        return self._inverse_scale(yhat)
+    
     def forecast(self, data:np.ndarray)->np.ndarray:
-        """Forecast PM2.5 values 7 days ahead using the last 30 days of data.
-        This data must include daily readings for PM25, temperature, relative 
-        humidity, wind speed and wind direction.
+        """Forecast pollutant values 7 days ahead using the last 30 days of 
+        data. This data must include daily readings for the pollutant, 
+        temperature, relative humidity, wind speed and wind direction.
 
         Args:
             data (np.ndarray): Data for prediction.
 
         Returns:
-            np.ndarray: 7 day prediction for PM25.
+            np.ndarray: 7 day prediction for the pollutant.
         """
         # Scale data between 0 and 1
         scaled_data = self._scale_data(data)
@@ -136,8 +289,9 @@ class PM25Forecaster:
         # Supervised learning format
         supervised = self._series_to_supervised(scaled_data)
         
-        # Reshape data for LTSM
-        X = self._create_X_set(supervised)
+        # Reshape data for LTSM, with the days of each window in 
+        # chronological order since the data has the newest day first
+        X = self._create_X_set(supervised)[:, ::-1]
         
         # Get predictions
         yhat = self._predict(X)
@@ -146,4 +300,148 @@ class PM25Forecaster:
         inv_yhat = self._inverse_scale(yhat)
         
         return inv_yhat
-        
\ No newline at end of file
+
+    def forecast_batch(self, data:np.ndarray)->np.ndarray:
+        """Forecast pollutant values for several series with a single inference 
+        call. Each series must have the same format as the data passed to 
+        `forecast`.
+
+        Args:
+            data (np.ndarray): Data for prediction with shape 
+            (series, days, features).
+
+        Returns:
+            np.ndarray: Predictions with shape (series, days - `n_dependent`). 
+            The array is reused by the next call of the same thread, copy it 
+            to keep it.
+        """
+        n_series = data.shape[0]
+        
+        # Scale all series at once
+        scaled_data = self._scale_data(data, out=self._buffer("scaled", data.shape))
+        
+        # Windows of every series in LTSM format, as float32 like the model 
+        # inputs so they are not copied again before inference
+        windows = self._create_input_windows(scaled_data)
+        X = self._buffer("windows", windows.shape, dtype=np.float32)
+        np.copyto(X, windows)
+        X = X.reshape(-1, self.n_dependent, self.n_features)
+        
+        # Get predictions for every window
+        yhat = self._predict(X)
+        
+        # Inverse the scale and group the predictions by series
+        inv_yhat = self._inverse_scale(yhat, out=self._buffer("output", (yhat.size,)))
+        return inv_yhat.reshape(n_series, -1)
+
+    def forecast_samples(self, data:np.ndarray, n_samples:int, noise:float,
+                         seed:int=0)->np.ndarray:
+        """Forecast pollutant values 7 days ahead for the data and for 
+        `n_samples` perturbed copies of it, with a single inference call. Each 
+        copy adds Gaussian noise to every reading, with a standard deviation 
+        of `noise` times the spread of its feature in the data. The spread of 
+        the forecasts of the copies measures how sensitive the forecast is to 
+        errors in its inputs.
+
+        Args:
+            data (np.ndarray): Data for prediction, same format as for 
+            `forecast`.
+            n_samples (int): Number of perturbed copies.
+            noise (float): Noise of each reading relative to the standard 
+            deviation of its feature.
+            seed (int, optional): Seed of the noise, the same data always 
+            gets the same samples. Defaults to 0.
+
+        Returns:
+            np.ndarray: Predictions with shape (`n_samples` + 1, `n_pred`), the
+            first row is the forecast of the unperturbed data.
+        """
+        scaled_data = self._scale_data(data)
+        
+        # Perturbed copies of the series after the original one
+        rng = np.random.default_rng(seed)
+        samples = np.empty((n_samples + 1,) + scaled_data.shape)
+        samples[0] = scaled_data
+        rng.standard_normal(out=samples[1:])
+        samples[1:] *= noise * scaled_data.std(axis=0)
+        samples[1:] += scaled_data
+        
+        # Forecast windows of every copy in LTSM format
+        windows = self._create_input_windows(samples)[:, :self.n_pred]
+        X = np.ascontiguousarray(windows).reshape(-1, self.n_dependent, self.n_features)
+        
+        # Get predictions for every window at once
+        yhat = self._predict(X).reshape(n_samples + 1, self.n_pred, -1)
+        
+        # One day per window, or every day from the newest window
+        yhat = yhat[:, :, 0] if yhat.shape[-1] == 1 else yhat[:, 0]
+        return self._inverse_scale(yhat).reshape(n_samples + 1, -1)
+
+class PM25Forecaster(PollutantForecaster):
+    """
+    LSTM model for forecasting 7-day PM2.5 values based on the previous 23 days.
+    """
+    def __init__(self, model_filepath:str, scaler_filepath:str):
+        """Initialize PM25 Forecaster with filepaths to the LTSM model and 
+        MinMaxScaler model.
+
+        Args:
+            model_filename (str): Filepath to model.
+            scaler_filename (str): Filepath to data scaler.
+        """
+        super().__init__(model_filepath, scaler_filepath, pollutant="pm25")
+
+class MultiPollutantForecaster:
+    """
+    Forecast several pollutants with a single inference call. Each pollutant 
+    has its own LSTM model, and all of them are fused into one Keras graph.
+    """
+    def __init__(self, models:Dict[str, Tuple[str,str]]):
+        """Initialize the forecaster with the filepaths to the LSTM model and 
+        MinMaxScaler model of each pollutant.
+
+        Args:
+            models (Dict[str, Tuple[str,str]]): Filepaths to the model and data 
+            scaler by pollutant name.
+        """
+        self.members = {
+            pollutant: PollutantForecaster(model_filepath, scaler_filepath, pollutant)
+            for pollutant, (model_filepath, scaler_filepath) in models.items()
+        }
+        self.pollutants = list(self.members.keys())
+        # Columns expected in the data: every pollutant, then meteorology
+        self.columns = self.pollutants + METEOROLOGICAL_FEATURES
+        self.n_pred = self.members[self.pollutants[0]].n_pred
+        
+        self.model = fuse_models([member.model for member in self.members.values()])
+        
+    def forecast(self, data:np.ndarray)->Dict[str, np.ndarray]:
+        """Forecast the values of every pollutant 7 days ahead using the last 
+        30 days of data. The data must have the columns in `columns`: the 
+        daily readings of each pollutant followed by temperature, relative 
+        humidity, wind speed and wind direction.
+
+        Args:
+            data (np.ndarray): Data for prediction.
+
+        Returns:
+            Dict[str, np.ndarray]: 7 day prediction of each pollutant.
+        """
+        n_pollutants = len(self.pollutants)
+        meteorological = list(range(n_pollutants, len(self.columns)))
+        
+        # Input of each model with its pollutant and the meteorological data
+        inputs = [
+            member._create_forecast_input(data[:, [i] + meteorological])
+            for i, member in enumerate(self.members.values())
+        ]
+        
+        # Run all models at once
+        outputs = self.model.predict(inputs, verbose=0)
+        if n_pollutants == 1:
+            outputs = [outputs]
+        
+        return {
+            pollutant: self.members[pollutant]._read_forecast_output(yhat)
+            for pollutant, yhat in zip(self.pollutants, outputs)
+        }
@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def compute_etag(*parts:bytes)->str:
+    """Compute a strong ETag from the bytes that determine a response.
+
+    Args:
+        parts (bytes): Everything the response depends on.
+
+    Returns:
+        str: Quoted entity tag.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(hashlib.sha256(part).digest())
+    return f'"{digest.hexdigest()[:32]}"'
+
+def etag_matches(if_none_match:Optional[str], etag:str)->bool:
+    """Check if an `If-None-Match` header matches an ETag.
+
+    Args:
+        if_none_match (str): Value of the header, if any.
+        etag (str): Current entity tag.
+
+    Returns:
+        bool: True if the client already has the current representation.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]
+
+def _encoding_qualities(accept_encoding:Optional[str])->Dict[str, float]:
+    """Get the quality value of each content coding listed by a client,
+    including those excluded with q=0.
+
+    Args:
+        accept_encoding (str): Value of the `Accept-Encoding` header, if any.
+
+    Returns:
+        Dict[str, float]: Quality of each coding, in lowercase.
+    """
+    qualities = {}
+    for item in (accept_encoding or "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    return qualities
+
+def choose_encoding(accept_encoding:Optional[str])->Optional[str]:
+    """Choose the content coding of a response: the one with the highest
+    quality among brotli, if the `brotli` package is installed, and gzip.
+    Codings listed explicitly take their own quality, the others the one of
+    `*`. Brotli wins ties, and no compression is used if no coding is
+    accepted or `identity` has a higher quality.
+
+    Args:
+        accept_encoding (str): Value of the `Accept-Encoding` header, if any.
+
+    Returns:
+        str: "br", "gzip" or None for no compression.
+    """
+    qualities = _encoding_qualities(accept_encoding)
+    codings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in codings:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    if best is not None and qualities.get("identity", 0.0) > best_quality:
+        return None
+    return best
+
+def encode(body:bytes, encoding:Optional[str])->bytes:
+    """Compress a response body with a content coding.
+
+    Args:
+        body (bytes): Uncompressed body.
+        encoding (str): "br", "gzip" or None.
+
+    Returns:
+        bytes: Encoded body.
+    """
+    if encoding == "br":
+        return brotli.compress(body)
+    if encoding == "gzip":
+        # Fixed mtime so the same body always gives the same bytes
+        return gzip.compress(body, mtime=0)
+    return body
+
+def seconds_until_next_cycle(now:datetime, interval:timedelta)->int:
+    """Seconds left until the next ingestion cycle. Cycles start at midnight
+    and repeat every `interval`.
+
+    Args:
+        now (datetime): Current time.
+        interval (timedelta): Duration of each cycle.
+
+    Returns:
+        int: Seconds until the next cycle starts.
+    """
+    cycle_start = current_cycle(now, interval)
+    return max(1, int((cycle_start + interval - now).total_seconds()))
+
+def current_cycle(now:datetime, interval:timedelta)->datetime:
+    """Start of the ingestion cycle that contains a given time.
+
+    Args:
+        now (datetime): Current time.
+        interval (timedelta): Duration of each cycle.
+
+    Returns:
+        datetime: Start of the cycle.
+    """
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + ((now - midnight) // interval) * interval
@@ -1,9 +1,10 @@
 from forecaster import PM25Forecaster
 from database_manager import DBManager
-from scraper import SemadetScraper
+from scraper import SemadetScraper, ScrapingError
 from aqicalculator import AqiCalculator
 import config
 import numpy as np
+from datetime import date
 
 def main():
     db = DBManager(host=config.host, 
@@ -21,7 +22,14 @@ def main():
     
     # 1 - Scrape todays data
     scraper = SemadetScraper()
-    todays_data = scraper.get_todays_data()
+    try:
+        todays_data = scraper.get_todays_data()
+    except ScrapingError as e:
+        # Without today's readings, use yesterday's for every value
+        print(f"Error scraping today's data: {e}")
+        columns = db.pollutants + db.meteorological
+        todays_data = {"date": date.today().strftime('%Y-%m-%d')}
+        todays_data |= {column: None for column in columns}
     
     # If empty values for today, fill in with yesterdays data
     interpolate = []
@@ -38,10 +46,14 @@ def main():
 
     data_id = db.daily_data_exists(todays_data["date"])
     
-    if data_id:
-        db.update_daily_data(data_id, todays_data)
-    else:
-        db.insert_daily_data(todays_data)
+    try:
+        if data_id:
+            db.update_daily_data(data_id, todays_data)
+        else:
+            db.insert_daily_data(todays_data)
+    except Exception:
+        # The error was already printed, forecast with the stored days
+        pass
     
     # 3 - Get last thirty days
     monthly_data = db.get_last_n_daily_data(30)
@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import joblib
+
+import numpy_runtime
+
+# Published pointer of each base model by filepath: (mtime, pointer)
+_pointers = {}
+_pointers_lock = threading.Lock()
+
+def pointer_filepath(filepath:Path)->Path:
+    """Filepath of the pointer to the published version of a model, e.g.
+    `models/lstm_seven_step.current.json` for `models/lstm_seven_step.pkl`.
+
+    Args:
+        filepath (Path): Filepath of the base model.
+
+    Returns:
+        Path: Filepath of the pointer.
+    """
+    filepath = Path(filepath)
+    return filepath.with_name(f"{filepath.stem}.current.json")
+
+def current(filepath:Path)->Optional[dict]:
+    """Get the pointer to the published version of a model. It is only read
+    again from disk when it changes.
+
+    Args:
+        filepath (Path): Filepath of the base model.
+
+    Returns:
+        dict: Version, filepath and metadata of the published model, None if
+        no version was published.
+    """
+    pointer = pointer_filepath(filepath)
+    try:
+        mtime = pointer.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _pointers_lock:
+        cached = _pointers.get(pointer)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, json.loads(pointer.read_text()))
+            _pointers[pointer] = cached
+        return cached[1]
+
+def resolve(filepath:Path)->Path:
+    """Filepath of the published version of a model, or of the base model if
+    no version was published.
+
+    Args:
+        filepath (Path): Filepath of the base model.
+
+    Returns:
+        Path: Filepath of the model to load.
+    """
+    pointer = current(filepath)
+    if pointer is None:
+        return Path(filepath)
+    return Path(filepath).parent / pointer["filepath"]
+
+def _write_atomic(filepath:Path, write)->None:
+    """Write a file through a temporary file in the same directory, so
+    readers see either the old or the new file."""
+    fd, tmp_filepath = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        os.unlink(tmp_filepath)
+        raise
+
+def publish(model, filepath:Path, metadata:dict, exported_dir:Path=None)->dict:
+    """Publish a new version of a model: save it as a new versioned file in
+    `versions/`, export it for the NumPy runtime and point the base model to
+    it. The pointer is replaced last and atomically, so servers switch to the
+    new version at once and never see a partial file.
+
+    Args:
+        model: Keras model to publish.
+        filepath (Path): Filepath of the base model.
+        metadata (dict): Training information kept in the pointer.
+        exported_dir (Path, optional): Directory of the NumPy exports.
+            Defaults to `exported/` next to the base model.
+
+    Returns:
+        dict: New pointer.
+
+    Raises:
+        ValueError: If the model cannot be exported for the NumPy runtime.
+    """
+    filepath = Path(filepath)
+    exported_dir = exported_dir or filepath.parent / "exported"
+    previous = current(filepath)
+    version = previous["version"] + 1 if previous else 1
+    created = datetime.now()
+
+    versions_dir = filepath.parent / "versions"
+    versions_dir.mkdir(exist_ok=True)
+    version_filepath = versions_dir / f"{filepath.stem}-v{version}-{created:%Y%m%d%H%M%S}.pkl"
+    _write_atomic(version_filepath, lambda file: joblib.dump(model, file))
+
+    # Export to a temporary directory renamed once complete
+    exported_dir.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=exported_dir, prefix="."))
+    try:
+        numpy_runtime.export(model, tmp_dir)
+    except ValueError:
+        # The runtime would not predict like the model, keep the current version
+        shutil.rmtree(tmp_dir)
+        version_filepath.unlink()
+        raise
+    os.replace(tmp_dir, exported_dir / version_filepath.stem)
+
+    pointer = {
+        "version": version,
+        "filepath": str(version_filepath.relative_to(filepath.parent)),
+        "previous": previous["filepath"] if previous else filepath.name,
+        "created": created.isoformat(timespec="seconds")
+    } | metadata
+    _write_atomic(pointer_filepath(filepath), lambda file: file.write(json.dumps(pointer, indent=1).encode()))
+    return pointer
@@ -0,0 +1,296 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+# usage: python numpy_runtime.py models/ models/exported/
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": lambda x: np.tanh(x, out=x),
+    "sigmoid": lambda x: np.divide(1, np.add(1, np.exp(np.negative(x, out=x), out=x), out=x), out=x)
+}
+
+# LSTM options that change the computation and that the runtime does not
+# implement, with the value that the runtime assumes
+LSTM_DEFAULTS = {
+    "go_backwards": False,
+    "stateful": False,
+    "return_state": False,
+    "time_major": False
+}
+
+# Largest difference allowed between Keras and the runtime on the probe batch
+PROBE_TOLERANCE = 1e-4
+PROBE_SAMPLES = 4
+
+def _load_array(filepath:Path)->np.ndarray:
+    """Memory-map a `.npy` file read-only as a plain array."""
+    return np.asarray(np.load(filepath, mmap_mode="r"))
+
+class NumpySequential:
+    """
+    Keras Sequential model of LSTM and Dense layers evaluated with NumPy, so
+    the models can be served without loading TensorFlow. The weights are
+    memory-mapped read-only from `.npy` files: processes using the same
+    files share their pages, and forked processes never copy them.
+    """
+    def __init__(self, directory:str):
+        """Load a model exported with `export`.
+
+        Args:
+            directory (str): Directory of the exported model.
+        """
+        directory = Path(directory)
+        spec = json.loads((directory / "model.json").read_text())
+        self.name = spec["name"]
+        self.input_shape = tuple(spec["input_shape"])
+        self.output_shape = tuple(spec["output_shape"])
+        self.layers = [
+            layer | {"weights": [_load_array(directory / filename) for filename in layer["weights"]]}
+            for layer in spec["layers"]
+        ]
+
+    def _lstm(self, X:np.ndarray, layer:dict)->np.ndarray:
+        """Run an LSTM layer with Keras gate order (input, forget, cell,
+        output) on inputs with shape (samples, time_steps, features)."""
+        kernel, recurrent_kernel, bias = layer["weights"]
+        activation = ACTIVATIONS[layer["activation"]]
+        recurrent_activation = ACTIVATIONS[layer["recurrent_activation"]]
+        units = layer["units"]
+
+        # Input contribution of every time step at once
+        Z = X @ kernel + bias
+        h = np.zeros((X.shape[0], units), dtype=X.dtype)
+        c = np.zeros((X.shape[0], units), dtype=X.dtype)
+        outputs = []
+        for t in range(X.shape[1]):
+            z = Z[:, t] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2*units])
+            g = activation(z[:, 2*units:3*units])
+            o = recurrent_activation(z[:, 3*units:])
+            c = f * c + i * g
+            h = o * activation(c.copy())
+            outputs.append(h)
+        return np.stack(outputs, axis=1) if layer["return_sequences"] else h
+
+    def _dense(self, X:np.ndarray, layer:dict)->np.ndarray:
+        """Run a Dense layer."""
+        kernel, bias = layer["weights"]
+        return ACTIVATIONS[layer["activation"]](X @ kernel + bias)
+
+    def predict(self, X:np.ndarray, verbose:int=0)->np.ndarray:
+        """Predict like `keras.Model.predict`.
+
+        Args:
+            X (np.ndarray): Inputs with shape (samples, time_steps, features).
+            verbose (int, optional): Ignored, kept for compatibility.
+
+        Returns:
+            np.ndarray: Model outputs.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        for layer in self.layers:
+            X = self._lstm(X, layer) if layer["type"] == "LSTM" else self._dense(X, layer)
+        return X
+
+class NumpyModelGroup:
+    """
+    Several NumPy models called with one `predict`, the counterpart of a
+    fused Keras model.
+    """
+    def __init__(self, models:List[NumpySequential]):
+        self.models = models
+
+    def predict(self, inputs:List[np.ndarray], verbose:int=0)->List[np.ndarray]:
+        """Predict with each model on its own input."""
+        outputs, _ = self.predict_timed(inputs)
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def predict_timed(self, inputs:List[np.ndarray])->Tuple[List[np.ndarray], List[float]]:
+        """Predict with each model on its own input, timing each model.
+
+        Args:
+            inputs (List[np.ndarray]): Input of each model.
+
+        Returns:
+            Tuple[List[np.ndarray], List[float]]: Output of each model and
+            the seconds it took.
+        """
+        outputs, latencies = [], []
+        for model, X in zip(self.models, inputs):
+            start = time.perf_counter()
+            outputs.append(model.predict(X))
+            latencies.append(time.perf_counter() - start)
+        return outputs, latencies
+
+class NumpyScaler:
+    """
+    Parameters of a fitted MinMaxScaler, memory-mapped like the models.
+    """
+    def __init__(self, directory:str):
+        """Load a scaler exported with `export`.
+
+        Args:
+            directory (str): Directory of the exported scaler.
+        """
+        directory = Path(directory)
+        self.min_ = _load_array(directory / "min.npy")
+        self.scale_ = _load_array(directory / "scale.npy")
+
+def _check_layer(layer)->None:
+    """Make sure the runtime computes a Keras layer like Keras does.
+
+    Args:
+        layer: Keras layer.
+
+    Raises:
+        ValueError: If the layer type or one of its options is not supported.
+    """
+    kind = type(layer).__name__
+    if kind not in ("LSTM", "Dense"):
+        raise ValueError(f"Layer {layer.name} of type {kind} is not supported")
+
+    config = layer.get_config()
+    activations = ["activation", "recurrent_activation"] if kind == "LSTM" else ["activation"]
+    for key in activations:
+        if config[key] not in ACTIVATIONS:
+            raise ValueError(f"Layer {layer.name} uses the unsupported {key} {config[key]}")
+    if not config.get("use_bias", True):
+        raise ValueError(f"Layer {layer.name} must use a bias")
+    if kind == "LSTM":
+        for key, value in LSTM_DEFAULTS.items():
+            if config.get(key, value) != value:
+                raise ValueError(f"Layer {layer.name} must have {key}={value}")
+
+def _check_export(model, directory:Path)->None:
+    """Compare the predictions of a Keras model and of its export on a random
+    probe batch.
+
+    Args:
+        model: Keras model.
+        directory (Path): Directory of the exported model.
+
+    Raises:
+        ValueError: If the predictions differ by more than `PROBE_TOLERANCE`.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.random((PROBE_SAMPLES,) + tuple(model.input_shape[1:]), dtype=np.float32)
+    expected = np.asarray(model.predict(X, verbose=0))
+    difference = float(np.abs(NumpySequential(directory).predict(X) - expected).max())
+    if not difference <= PROBE_TOLERANCE:
+        raise ValueError(f"Export of {model.name} differs from Keras by {difference:.2e}")
+
+def export(obj, directory:str)->None:
+    """Export a Keras Sequential model of LSTM and Dense layers or a fitted
+    MinMaxScaler to a directory that can be loaded with `load`. Models are
+    checked against Keras on a probe batch after exporting them.
+
+    Args:
+        obj: Keras model or MinMaxScaler.
+        directory (str): Directory to write to.
+
+    Raises:
+        ValueError: If the model has layers or options that the runtime does
+        not support, or its export does not predict like Keras.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    if hasattr(obj, "scale_"):
+        np.save(directory / "min.npy", np.asarray(obj.min_, dtype=float))
+        np.save(directory / "scale.npy", np.asarray(obj.scale_, dtype=float))
+        (directory / "model.json").write_text(json.dumps({"type": "MinMaxScaler"}))
+        return
+
+    for layer in obj.layers:
+        _check_layer(layer)
+
+    layers = []
+    for i, layer in enumerate(obj.layers):
+        kind = type(layer).__name__
+        config = layer.get_config()
+        spec = {
+            "type": kind,
+            "units": config["units"],
+            "activation": config["activation"],
+            "weights": []
+        }
+        if kind == "LSTM":
+            spec["recurrent_activation"] = config["recurrent_activation"]
+            spec["return_sequences"] = config["return_sequences"]
+        names = ["kernel", "recurrent_kernel", "bias"] if kind == "LSTM" else ["kernel", "bias"]
+        for name, weights in zip(names, layer.get_weights()):
+            filename = f"{i}_{name}.npy"
+            np.save(directory / filename, weights.astype(np.float32))
+            spec["weights"].append(filename)
+        layers.append(spec)
+
+    spec = {
+        "type": "Sequential",
+        "name": obj.name,
+        "input_shape": list(obj.input_shape),
+        "output_shape": list(obj.output_shape),
+        "layers": layers
+    }
+    (directory / "model.json").write_text(json.dumps(spec, indent=1))
+
+    try:
+        _check_export(obj, directory)
+    except ValueError:
+        # Leave nothing that `load` would accept
+        (directory / "model.json").unlink()
+        raise
+
+def load(directory:str):
+    """Load a model or scaler exported with `export`.
+
+    Args:
+        directory (str): Directory of the exported model or scaler.
+
+    Returns:
+        NumpySequential or NumpyScaler: Loaded model or scaler.
+    """
+    spec = json.loads((Path(directory) / "model.json").read_text())
+    if spec["type"] == "MinMaxScaler":
+        return NumpyScaler(directory)
+    return NumpySequential(directory)
+
+def export_all(models_dir:str, output_dir:str)->List[Path]:
+    """Export every pickled model (`.pkl`) and scaler (`.save`) of a
+    directory, each to a subdirectory named after its file.
+
+    Args:
+        models_dir (str): Directory with the pickled models.
+        output_dir (str): Directory to write the exported models to.
+
+    Returns:
+        List[Path]: Directories of the exported models.
+    """
+    import joblib
+
+    exported = []
+    for filepath in sorted(Path(models_dir).glob("*.pkl")) + sorted(Path(models_dir).glob("*.save")):
+        directory = Path(output_dir) / filepath.stem
+        export(joblib.load(filepath), directory)
+        exported.append(directory)
+    return exported
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Export the models to be served without TensorFlow.")
+    parser.add_argument("models_dir", nargs="?", default="models",
+                        help="directory with the pickled models")
+    parser.add_argument("output_dir", nargs="?", default="models/exported",
+                        help="directory to write the exported models to")
+    args = parser.parse_args()
+
+    for directory in export_all(args.models_dir, args.output_dir):
+        print(f"Exported {directory}")
+
+if __name__ == "__main__":
+    main()
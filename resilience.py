@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import Any, Callable
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose circuit is open.
+    """
+    def __init__(self, name:str, retry_after:float):
+        super().__init__(f"Circuit {name} is open, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Stop calling a failing dependency for a while. After `failure_threshold`
+    consecutive failures the circuit opens and calls fail immediately with
+    `CircuitOpenError`. Once `reset_timeout` seconds pass, a single trial call
+    is let through: if it succeeds the circuit closes, otherwise it opens
+    again.
+    """
+    def __init__(self, name:str, failure_threshold:int, reset_timeout:float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def _before_call(self)->None:
+        """Let a call through or raise `CircuitOpenError`."""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self.trial_in_flight:
+                raise CircuitOpenError(self.name, max(remaining, 0))
+            # Half-open: this call decides the state of the circuit
+            self.trial_in_flight = True
+
+    def _after_call(self, success:bool)->None:
+        """Update the state of the circuit with the outcome of a call."""
+        with self.lock:
+            self.trial_in_flight = False
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.opened_at is not None or self.failures >= self.failure_threshold:
+                    self.opened_at = time.monotonic()
+
+    def call(self, fn:Callable, *args, **kwargs)->Any:
+        """Call a function through the circuit.
+
+        Args:
+            fn (Callable): Function calling the dependency.
+
+        Returns:
+            Any: Result of the function.
+        """
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._after_call(success=False)
+            raise
+        self._after_call(success=True)
+        return result
+
+    def protect(self, obj:Any)->Any:
+        """Wrap an object so that all its method calls go through the circuit.
+
+        Args:
+            obj (Any): Object calling the dependency.
+
+        Returns:
+            Any: Object with the same methods.
+        """
+        return _ProtectedObject(obj, self)
+
+    def status(self)->dict:
+        """Get the state of the circuit: closed, open or half_open."""
+        with self.lock:
+            if self.opened_at is None:
+                state = "closed"
+            elif time.monotonic() - self.opened_at < self.reset_timeout:
+                state = "open"
+            else:
+                state = "half_open"
+            return {"state": state, "failures": self.failures}
+
+class _ProtectedObject:
+    """
+    Proxy running the methods of an object through a circuit breaker.
+    """
+    def __init__(self, obj:Any, breaker:CircuitBreaker):
+        self._obj = obj
+        self._breaker = breaker
+
+    def __getattr__(self, name:str)->Any:
+        attr = getattr(self._obj, name)
+        if not callable(attr):
+            return attr
+        return lambda *args, **kwargs: self._breaker.call(attr, *args, **kwargs)
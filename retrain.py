@@ -0,0 +1,248 @@
+import argparse
+import sys
+from datetime import date
+from pathlib import Path
+from typing import Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+import model_registry
+from aqicalculator import AqiCalculator
+from forecaster import PM25Forecaster
+
+# usage: python retrain.py --source csv --epochs 5
+#        python retrain.py --source db --dry-run
+
+MODEL_FILEPATH = Path("models/lstm_seven_step.pkl")
+SCALER_FILEPATH = Path("models/scaler.save")
+CSV_FILEPATH = Path("semadet-aire-bd.csv")
+FEATURES = ["pm25", "tmp", "rh", "ws", "wd"]
+
+def load_series(source:str)->Tuple[np.ndarray, np.ndarray]:
+    """Load the stored daily data in chronological order, from the database
+    or from the CSV of historical data when the database is not available.
+
+    Args:
+        source (str): "db" or "csv".
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Date of each day and an array with the
+        daily readings of PM25, temperature, relative humidity, wind speed and
+        wind direction.
+    """
+    if source == "csv":
+        df = pd.read_csv(CSV_FILEPATH)
+        return df["date"].to_numpy(dtype="datetime64[D]"), df[FEATURES].to_numpy(dtype=float)
+
+    import config
+    from database_manager import DBManager
+    db = DBManager(host=config.host, port=config.port, user=config.user,
+                   password=config.password, db=config.db)
+    dates, data = db.get_daily_data_range("1900-01-01", date.today().isoformat())
+    return np.asarray(dates, dtype="datetime64[D]"), data
+
+class WindowDataset:
+    """
+    Supervised windows of a daily series, built as views so the windows are
+    only copied one batch at a time. Window `i` has the `n_dependent` days
+    starting at day `i` and its target is the scaled PM25 of the `horizon`
+    days after them.
+    """
+    def __init__(self, forecaster:PM25Forecaster, dates:np.ndarray, data:np.ndarray):
+        self.forecaster = forecaster
+        self.horizon = forecaster.model.output_shape[-1]
+        span = forecaster.n_dependent + self.horizon
+
+        scaled = forecaster._scale_data(data)
+        self.windows = forecaster._create_windows(scaled)
+        self.targets = sliding_window_view(scaled[forecaster.n_dependent:, forecaster.pollutant_idx],
+                                           self.horizon)
+        n_windows = len(data) - span + 1
+
+        # Windows must cover consecutive days without missing readings
+        days = dates.astype(int)
+        consecutive = days[span-1:] - days[:n_windows] == span - 1
+        missing = np.concatenate([[0], np.cumsum(np.isnan(data).any(axis=1))])
+        complete = missing[span:] - missing[:n_windows] == 0
+        self.valid = np.flatnonzero(consecutive & complete)
+
+        # Last target day of each window
+        self.target_dates = dates[span-1:]
+
+    def select(self, start:np.datetime64=None, end:np.datetime64=None)->np.ndarray:
+        """Valid windows whose targets are between two dates.
+
+        Args:
+            start (np.datetime64, optional): First day, inclusive.
+            end (np.datetime64, optional): Last day, exclusive.
+
+        Returns:
+            np.ndarray: Indexes of the windows.
+        """
+        target_dates = self.target_dates[self.valid]
+        mask = np.ones(len(self.valid), dtype=bool)
+        if start is not None:
+            mask &= target_dates - (self.horizon - 1) >= start
+        if end is not None:
+            mask &= target_dates < end
+        return self.valid[mask]
+
+    def batches(self, idxs:np.ndarray, batch_size:int)->Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Copy the windows and targets of a set of windows, one batch at a
+        time.
+
+        Args:
+            idxs (np.ndarray): Indexes of the windows.
+            batch_size (int): Windows per batch.
+
+        Yields:
+            Tuple[np.ndarray, np.ndarray]: Inputs and targets of the batch.
+        """
+        for start in range(0, len(idxs), batch_size):
+            batch = idxs[start:start + batch_size]
+            yield (np.ascontiguousarray(self.windows[batch], dtype=np.float32),
+                   np.ascontiguousarray(self.targets[batch], dtype=np.float32))
+
+def evaluate(model, dataset:WindowDataset, idxs:np.ndarray, batch_size:int)->dict:
+    """Backtest a model on a set of windows: MAE and RMSE of the PM25
+    predictions in µg/m³, and share of days with the right AQI category.
+
+    Args:
+        model: Keras model.
+        dataset (WindowDataset): Windows of the series.
+        idxs (np.ndarray): Indexes of the windows.
+        batch_size (int): Windows per inference call.
+
+    Returns:
+        dict: Metrics of the model.
+    """
+    forecaster = dataset.forecaster
+    predictions, actuals = [], []
+    for X, y in dataset.batches(idxs, batch_size):
+        predictions.append(forecaster._inverse_scale(model.predict(X, verbose=0)))
+        actuals.append(forecaster._inverse_scale(y))
+    predictions, actuals = np.concatenate(predictions), np.concatenate(actuals)
+
+    aqi_calc = AqiCalculator()
+    predicted_categories = aqi_calc.get_aqi_category_ids(aqi_calc.get_pollutant_aqi_nums("pm25", predictions))
+    actual_categories = aqi_calc.get_aqi_category_ids(aqi_calc.get_pollutant_aqi_nums("pm25", actuals))
+
+    errors = predictions - actuals
+    return {
+        "windows": int(len(idxs)),
+        "mae": float(np.abs(errors).mean()),
+        "rmse": float(np.sqrt((errors ** 2).mean())),
+        "category_accuracy": float((predicted_categories == actual_categories).mean())
+    }
+
+def fine_tune(model, dataset:WindowDataset, idxs:np.ndarray, epochs:int, batch_size:int,
+              learning_rate:float, seed:int):
+    """Continue training a copy of a model from its current weights. The
+    windows are shuffled each epoch and fed one batch at a time.
+
+    Args:
+        model: Keras model.
+        dataset (WindowDataset): Windows of the series.
+        idxs (np.ndarray): Indexes of the training windows.
+        epochs (int): Passes over the training windows.
+        batch_size (int): Windows per training step.
+        learning_rate (float): Learning rate of the Adam optimizer.
+        seed (int): Seed of the shuffling.
+
+    Returns:
+        Fine-tuned copy of the model.
+    """
+    import keras
+
+    candidate = keras.models.clone_model(model)
+    candidate.set_weights(model.get_weights())
+    candidate.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate), loss="mse")
+
+    rng = np.random.default_rng(seed)
+    for epoch in range(epochs):
+        losses = [
+            float(candidate.train_on_batch(X, y))
+            for X, y in dataset.batches(rng.permutation(idxs), batch_size)
+        ]
+        print(f"Epoch {epoch + 1}/{epochs}: loss {np.mean(losses):.6f}")
+    return candidate
+
+def main()->int:
+    parser = argparse.ArgumentParser(description="Fine-tune the forecast model with the latest days and publish it.")
+    parser.add_argument("--source", choices=["db", "csv"], default="db", help="where to read the daily data from")
+    parser.add_argument("--model", type=Path, default=MODEL_FILEPATH, help="base model to update")
+    parser.add_argument("--since", type=date.fromisoformat,
+                        help="first target day of the new windows, defaults to the day after the last training")
+    parser.add_argument("--holdout-days", type=int, default=60, help="latest days kept for validation")
+    parser.add_argument("--replay", type=float, default=1.0,
+                        help="older windows mixed in per new window, to keep what the model learned")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--learning-rate", type=float, default=1e-4)
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="allowed relative RMSE increase on the holdout to publish")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dry-run", action="store_true", help="train and validate without publishing")
+    args = parser.parse_args()
+
+    # Current version of the model and the data it was trained with
+    pointer = model_registry.current(args.model)
+    forecaster = PM25Forecaster(model_filepath=model_registry.resolve(args.model),
+                                scaler_filepath=SCALER_FILEPATH)
+    dates, data = load_series(args.source)
+    dataset = WindowDataset(forecaster, dates, data)
+
+    holdout_start = dates[-1] - np.timedelta64(args.holdout_days - 1, "D")
+    if args.since:
+        since = np.datetime64(args.since)
+    elif pointer and pointer.get("trained_until"):
+        since = np.datetime64(pointer["trained_until"]) + np.timedelta64(1, "D")
+    else:
+        since = holdout_start - np.timedelta64(365, "D")
+
+    new_idxs = dataset.select(start=since, end=holdout_start)
+    holdout_idxs = dataset.select(start=holdout_start)
+    if len(new_idxs) == 0:
+        print(f"No new windows since {since}, nothing to train")
+        return 0
+    if len(holdout_idxs) == 0:
+        print(f"No holdout windows since {holdout_start}")
+        return 1
+
+    # Replay older windows along with the new ones
+    rng = np.random.default_rng(args.seed)
+    old_idxs = dataset.select(end=since)
+    n_replay = min(len(old_idxs), int(len(new_idxs) * args.replay))
+    train_idxs = np.concatenate([new_idxs, rng.choice(old_idxs, n_replay, replace=False)])
+    print(f"Training on {len(new_idxs)} new and {n_replay} older windows, "
+          f"validating on {len(holdout_idxs)} windows since {holdout_start}")
+
+    baseline = evaluate(forecaster.model, dataset, holdout_idxs, args.batch_size)
+    candidate = fine_tune(forecaster.model, dataset, train_idxs, args.epochs,
+                          args.batch_size, args.learning_rate, args.seed)
+    metrics = evaluate(candidate, dataset, holdout_idxs, args.batch_size)
+    for name, values in [("current", baseline), ("candidate", metrics)]:
+        print(f"{name:<10} MAE {values['mae']:.3f}  RMSE {values['rmse']:.3f}  "
+              f"category accuracy {values['category_accuracy']:.1%}")
+
+    if metrics["rmse"] > baseline["rmse"] * (1 + args.tolerance):
+        print("The candidate is worse than the current model on the holdout, not publishing")
+        return 1
+    if args.dry_run:
+        return 0
+
+    # Last day whose data was used for training
+    trained_until = dataset.target_dates[new_idxs].max()
+    pointer = model_registry.publish(candidate, args.model, {
+        "trained_until": str(trained_until),
+        "holdout_start": str(holdout_start),
+        "holdout": metrics,
+        "baseline": baseline
+    })
+    print(f"Published version {pointer['version']} as {pointer['filepath']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,13 +9,30 @@ from selenium.common.exceptions import StaleElementReferenceException
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+class ScrapingError(Exception):
+    """
+    Raised when the data could not be obtained from the SEMADET website.
+    """
+
 class SemadetScraper:
     """
     Web scraper to obtain the daily data from the SEMADET website.
     """
-    def __init__(self):
+    def __init__(self, attempts:int=2, timeout:float=20):
+        """Initialize the scraper.
+
+        Args:
+            attempts (int, optional): Times to try to scrape each table. 
+            Defaults to 2.
+            timeout (float, optional): Seconds to wait for the page and each 
+            table to load. Defaults to 20.
+        """
         self.website_link = "https://aire.jalisco.gob.mx/porestacion"
         self.city = "Tlaquepaque"
+        self.attempts = attempts
+        self.timeout = timeout
+        # Pollutant in each column of the concentration table, after the date
+        self.pollutant_columns = ["o3", "no2", "so2", "co", "pm10", "pm25"]
         
     def _to_numerical(self, value:str)->float:
         """Convert a string to a float. If it can't be converted, returns None.
@@ -34,22 +51,22 @@ class SemadetScraper:
             
     def _scrape_meteorological_data(self)->Dict[str,List[float]]:
         """Scrape the meteorological data: temperature, relative humidity, 
-        wind direction and wind speed from the Semadet website. It tries at
-        least twice to do this, if it fails, it returns a dictionary with empty
-        keys.
+        wind direction and wind speed from the Semadet website. It tries 
+        `attempts` times to do this, if it fails, it raises a ScrapingError.
 
         Returns:
             dict: Dictionary with keys for tmp, rh, wd, and ws and a list of values
             for each.
         """
-        # Try twice to scrape data
-        for attempt in range(2):
+        # Try several times to scrape data
+        for attempt in range(self.attempts):
             driver = None
             try:
                 # Create a web driver that doesn't open browser
                 op = webdriver.ChromeOptions()
                 op.add_argument('headless')
                 driver = webdriver.Chrome(options=op)
+                driver.set_page_load_timeout(self.timeout)
                 driver.get(self.website_link)
                 
                 # Select city
@@ -62,12 +79,12 @@ class SemadetScraper:
                 driver.find_element(By.ID, "Button1").click()
 
                 # Wait for the table to load
-                WebDriverWait(driver, 20).until(
+                WebDriverWait(driver, self.timeout).until(
                     EC.presence_of_element_located((By.ID, "MET"))
                 )
 
                 # Wait for table rows to load
-                WebDriverWait(driver, 20).until(
+                WebDriverWait(driver, self.timeout).until(
                     lambda d: d.find_elements(By.CSS_SELECTOR, "#MET tr")
                 )
 
@@ -107,25 +124,27 @@ class SemadetScraper:
                 if driver:
                     driver.quit()
                     
-        # Return empty dictionary by default
-        return { "tmp":[], "rh":[], "ws":[], "wd":[]}
+        raise ScrapingError("Could not fetch meteorological data")
             
     def _scrape_pollutant_data(self)->Dict[str,List[float]]:
-        """Scrape the pollutant concentration data: particulate matter below 2.5 
-        micrometers from the Semadet website. It tries at least twice to do this, 
-        if it fails, it returns a dictionary with empty keys.
+        """Scrape the pollutant concentration data: ozone, nitrogen dioxide, 
+        sulfur dioxide, carbon monoxide and particulate matter below 10 and 2.5 
+        micrometers from the Semadet website. It tries `attempts` times to do 
+        this, if it fails, it raises a ScrapingError.
 
         Returns:
-            dict: Dictionary with a key for pm25 and a list of values for it.
+            dict: Dictionary with keys for o3, no2, so2, co, pm10 and pm25 and 
+            a list of values for each.
         """
-        # Try twice to scrape data
-        for attempt in range(2):
+        # Try several times to scrape data
+        for attempt in range(self.attempts):
             driver = None
             try:
                 # Create a web driver that doesn't open browser
                 op = webdriver.ChromeOptions()
                 op.add_argument('headless')
                 driver = webdriver.Chrome(options=op)
+                driver.set_page_load_timeout(self.timeout)
                 driver.get(self.website_link)
                 
                 # Select city
@@ -138,12 +157,12 @@ class SemadetScraper:
                 driver.find_element(By.ID, "Button1").click()
 
                 # Wait for the table to load
-                WebDriverWait(driver, 20).until(
+                WebDriverWait(driver, self.timeout).until(
                     EC.presence_of_element_located((By.ID, "CEN"))
                 )
 
                 # Wait for table rows to load
-                WebDriverWait(driver, 20).until(
+                WebDriverWait(driver, self.timeout).until(
                     lambda d: d.find_elements(By.CSS_SELECTOR, "#CEN tr")
                 )
 
@@ -151,7 +170,7 @@ class SemadetScraper:
                 rows = driver.find_elements(By.CSS_SELECTOR, "#CEN tr")
                 
                 # Dictionary to store table data in order
-                data = { "pm25":[]}
+                data = {pollutant: [] for pollutant in self.pollutant_columns}
 
                 for i, row in enumerate(rows):
                     try:
@@ -162,11 +181,11 @@ class SemadetScraper:
                     
                         if len(cells) == 7:  # Expected number of columns
                             for i, cell in enumerate(cells):
-                                # Only extract pm25 in column 6
-                                if i != 6:
+                                # The first column is the date
+                                if i != 0:
                                     value = self._to_numerical(cell.text)
                                     if(value != None):
-                                        data["pm25"].append(value)
+                                        data[self.pollutant_columns[i-1]].append(value)
                     except StaleElementReferenceException:
                         print(f"Row {i} went stale. Skipping.")
                         continue
@@ -181,8 +200,7 @@ class SemadetScraper:
                 if driver:
                     driver.quit()
                     
-        # Return empty dictionary by default
-        return { "pm25":[]}
+        raise ScrapingError("Could not fetch pollutant data")
                 
     def _circular_mean(self, angles:List[float])->float:
         """Calculate the circular mean of a list of angles between 0 and 360.
@@ -239,12 +257,13 @@ class SemadetScraper:
         
     def _get_pollutant_data(self)->Dict[str,List[float]]:
         """Obtain the current day's pollutant concentration data from the 
-        Semadet Website. This data is: particulate matter below 2.5 micrometers. 
+        Semadet Website. This data is: ozone, nitrogen dioxide, sulfur dioxide, 
+        carbon monoxide and particulate matter below 10 and 2.5 micrometers. 
         It returns a dictionary with the average value of each entry. The
         keys will have either value None or a float.
         
         Returns:
-            Dict: Dictionary with keys for pm25.
+            Dict: Dictionary with keys for o3, no2, so2, co, pm10 and pm25.
         """
         data = self._scrape_pollutant_data()
         avg_data = self._avg_of_data(data)
@@ -264,13 +283,15 @@ class SemadetScraper:
     
     def get_todays_data(self)->dict:
         """Get today's information from the Semadet website. This is: 
-        temperature, relative humidity, wind direction, wind speed and 
-        particulate matter below 2.5 micrometers. It will return a dictionary 
-        with the following keys: date, tmp, rh, wd, and ws, and pm25. The
-        keys will have either value None or a float.
+        temperature, relative humidity, wind direction, wind speed and the 
+        concentration of every pollutant. It will return a dictionary with the 
+        following keys: date, tmp, rh, wd, and ws, and o3, no2, so2, co, pm10 
+        and pm25. The keys will have either value None or a float. Raises a 
+        ScrapingError if the website could not be scraped.
         
         Returns:
-            dict: A dictionary with keys for date, tmp, rh, wd, and ws and pm25.
+            dict: A dictionary with keys for date, tmp, rh, wd, and ws and 
+            o3, no2, so2, co, pm10 and pm25.
         """
         todays_date = {"date": self._todays_date()}
         pltnt_data = self._get_pollutant_data()
@@ -0,0 +1,157 @@
+import argparse
+import gc
+import importlib
+import os
+import signal
+import socket
+import subprocess
+import sys
+from pathlib import Path
+
+# usage: python serve.py --workers 4 --threads 1 --port 8000
+
+# Variables read by the numerical libraries to size their thread pools
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS"
+]
+
+def cap_threads(threads:int)->None:
+    """Limit the inference threads of each process. It must be called before
+    NumPy or TensorFlow are imported.
+
+    Args:
+        threads (int): Threads per process.
+    """
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+
+def export_models(models_dir:Path, output_dir:Path)->None:
+    """Export the pickled models for the NumPy runtime if they changed since
+    the last export. The export runs in a subprocess, so TensorFlow is never
+    loaded in the serving processes.
+
+    Args:
+        models_dir (Path): Directory with the pickled models.
+        output_dir (Path): Directory of the exported models.
+    """
+    pickles = list(models_dir.glob("*.pkl")) + list(models_dir.glob("*.save"))
+    exports = [output_dir / filepath.stem / "model.json" for filepath in pickles]
+    if all(export.exists() and export.stat().st_mtime >= pickle.stat().st_mtime
+           for pickle, export in zip(pickles, exports)):
+        return
+    subprocess.run([sys.executable, "numpy_runtime.py", str(models_dir), str(output_dir)], check=True)
+
+def _load_app(app:str, factory:bool):
+    """Import an ASGI app given as `module:attribute`."""
+    module_name, attribute = app.split(":")
+    app = getattr(importlib.import_module(module_name), attribute)
+    return app() if factory else app
+
+def _run_worker(app, sock:socket.socket)->None:
+    """Serve requests on a socket inherited from the parent."""
+    import uvicorn
+
+    # Let the parent handle Ctrl+C and stop the workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    server.run(sockets=[sock])
+
+def serve(app:str, host:str, port:int, workers:int, runtime:str, factory:bool=False)->None:
+    """Load the app once and fork the workers that serve it. Everything loaded
+    by the parent, like the models, is shared with the workers through
+    copy-on-write memory, and the weights of exported models are shared
+    memory-mapped files.
+
+    Args:
+        app (str): ASGI app as `module:attribute`.
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        workers (int): Number of worker processes.
+        runtime (str): Runtime of the models, "numpy" or "keras". Keras 
+            models are loaded by each worker, since TensorFlow does not 
+            support forking after it is initialized.
+        factory (bool, optional): Whether the attribute is a function that
+            creates the app. Defaults to False.
+    """
+    app = _load_app(app, factory)
+
+    import server
+    server.MODEL_RUNTIME = runtime
+    if runtime == "numpy":
+        server.load_models()
+
+    # Keep the garbage collector from writing to the inherited objects,
+    # which would copy their memory pages into every worker
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    def fork_worker()->int:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock)
+            finally:
+                os._exit(0)
+        return pid
+
+    pids = {fork_worker() for _ in range(workers)}
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+
+    stopping = False
+    def stop(signum, frame)->None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Replace workers that die until asked to stop
+    while pids:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        pids.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting it")
+            pids.add(fork_worker())
+    sock.close()
+
+def main()->None:
+    parser = argparse.ArgumentParser(description="Serve the API with several worker processes that share the models.")
+    parser.add_argument("--app", default="server:app", help="ASGI app as module:attribute")
+    parser.add_argument("--factory", action="store_true", help="the app attribute is a function that creates the app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=1, help="inference threads per worker")
+    parser.add_argument("--runtime", choices=["numpy", "keras"], default="numpy",
+                        help="numpy shares the exported models with the workers, keras loads them in each worker")
+    args = parser.parse_args()
+
+    cap_threads(args.threads)
+    if args.runtime == "numpy":
+        export_models(Path("models"), Path("models/exported"))
+
+    serve(args.app, args.host, args.port, args.workers, args.runtime, args.factory)
+
+if __name__ == "__main__":
+    main()
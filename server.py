@@ -1,90 +1,692 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
-from pydantic import BaseModel
-from typing import List, Dict
+from pydantic import BaseModel, model_validator
+from typing import List, Dict, Iterator, Literal, Optional
+import hashlib
+import json
+import math
+import time
+import uuid
+import numpy as np
 
 import config
-from forecaster import PM25Forecaster
+from forecaster import PM25Forecaster, MultiPollutantForecaster
+from ensemble import ForecastEnsemble
 from database_manager import DBManager
 from scraper import SemadetScraper
 from aqicalculator import AqiCalculator
+import http_cache
+import model_registry
+from singleflight import SingleFlight
+from resilience import CircuitBreaker, CircuitOpenError
 
 app = FastAPI()
 # usage fastapi dev server.py
 # docs: http://localhost:8000/docs
 
+# Days of data needed for each forecast
+N_DAYS = 30
+# Model and scaler of the default forecast
+MODEL_FILEPATH = Path("models/lstm_seven_step.pkl")
+SCALER_FILEPATH = Path("models/scaler.save")
+# Runtime of the models: "keras" loads the pickles and "numpy" their exports
+# in EXPORTED_MODELS_DIR (see numpy_runtime.py), without TensorFlow
+MODEL_RUNTIME = getattr(config, "model_runtime", "keras")
+if MODEL_RUNTIME not in ("keras", "numpy"):
+    raise ValueError(f'model_runtime must be "keras" or "numpy", got {MODEL_RUNTIME!r}')
+EXPORTED_MODELS_DIR = Path("models/exported")
+# Time between ingestions of new data, the live forecast can only change then
+INGESTION_INTERVAL = timedelta(minutes=getattr(config, "ingestion_interval_minutes", 60))
+# Scraping is tried once per refresh, the circuit breaker spaces out retries
+SCRAPER_ATTEMPTS = 1
+SCRAPER_TIMEOUT = 20
+# Longest a scrape can take: each of the 2 tables waits for the page and
+# twice for the table on every attempt, after starting the browser
+SCRAPER_STARTUP = 15
+SCRAPER_MAX_DURATION = 2 * SCRAPER_ATTEMPTS * (SCRAPER_STARTUP + 3 * SCRAPER_TIMEOUT)
+# Seconds after which the ingestion lock of a process that died can be taken,
+# with margin so a slow but live scrape keeps it, and seconds between checks
+# while another process ingests
+INGESTION_LOCK_TTL = 2 * SCRAPER_MAX_DURATION
+INGESTION_LOCK_POLL = 0.5
+# Seconds a request waits for the ingestion of another process before giving
+# up, so a hung scrape elsewhere does not hold the request threads
+INGESTION_LOCK_WAIT = SCRAPER_MAX_DURATION
+# Maximum number of dates in a single batch request
+MAX_BATCH_DATES = 3660
+# Days spanned by the dates forecast at once while streaming a batch
+# response, which bounds the data kept in memory by a batch request
+BATCH_CHUNK_DATES = 366
+# Perturbed copies of the data for the uncertainty of the forecast, noise of
+# each reading relative to the spread of its feature and percentiles of the
+# prediction interval
+UNCERTAINTY_SAMPLES = 100
+UNCERTAINTY_NOISE = 0.5
+UNCERTAINTY_PERCENTILES = (5, 95)
+# Models served by the ensemble and A/B strategies, and their weights
+ENSEMBLE_MODELS = {
+    "lstm_seven_step": Path("models/lstm_seven_step.pkl"),
+    "lstm_7_step": Path("models/lstm_7_step.pkl"),
+    "lstm_one_step": Path("models/lstm_one_step.pkl"),
+    "lstm_1_step": Path("models/lstm_1_step.pkl")
+}
+ENSEMBLE_WEIGHTS = None
+# Model and scaler of each pollutant served by the multi-pollutant forecast
+POLLUTANT_MODELS = {
+    "pm25": (MODEL_FILEPATH, SCALER_FILEPATH)
+}
+
+# Last good live forecast of each variant of the request
+_last_good = {}
+# Start of the last ingestion cycle whose data is known to be stored
+_ingested_cycle = None
+# Concurrent ingestions and forecasts of this process are run only once
+_single_flight = SingleFlight()
+# Stop calling SEMADET or the database while they keep failing
+_scraper_breaker = CircuitBreaker("scraper", failure_threshold=2, reset_timeout=300)
+_db_breaker = CircuitBreaker("database", failure_threshold=3, reset_timeout=30)
+
 # Define response model for FastAPI docs and validation
 class ForecastResponse(BaseModel):
     forecast: List[dict]
+    stale: Optional[bool] = None
+    age: Optional[int] = None
+
+class BatchForecastRequest(BaseModel):
+    dates: Optional[List[date]] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+    @model_validator(mode="after")
+    def check_dates(self):
+        if self.dates is None and (self.start_date is None or self.end_date is None):
+            raise ValueError("Provide either dates or start_date and end_date")
+        if self.dates is not None and (self.start_date or self.end_date):
+            raise ValueError("Provide either dates or a date range, not both")
+        if self.dates is not None and not self.dates:
+            raise ValueError("dates must not be empty")
+        if self.start_date and self.end_date and self.start_date > self.end_date:
+            raise ValueError("start_date must not be after end_date")
+        if len(self.as_of_dates()) > MAX_BATCH_DATES:
+            raise ValueError(f"At most {MAX_BATCH_DATES} dates can be requested")
+        return self
+
+    def as_of_dates(self)->List[date]:
+        """Sorted list of unique dates to forecast from."""
+        if self.dates is not None:
+            return sorted(set(self.dates))
+        n_days = (self.end_date - self.start_date).days + 1
+        return [self.start_date + timedelta(days=i) for i in range(n_days)]
+
+def _runtime_filepath(filepath:Path)->Path:
+    """Filepath of the published version of a model or scaler for the
+    configured runtime"""
+    filepath = model_registry.resolve(filepath)
+    if MODEL_RUNTIME == "numpy":
+        return EXPORTED_MODELS_DIR / filepath.stem
+    return filepath
+
+def _get_forecaster()->PM25Forecaster:
+    """Get the forecaster of the published model"""
+    return _load_forecaster(_runtime_filepath(MODEL_FILEPATH), _runtime_filepath(SCALER_FILEPATH))
+
+@lru_cache(maxsize=2)
+def _load_forecaster(model_filepath:Path, scaler_filepath:Path)->PM25Forecaster:
+    """Load the model and scaler once per process and version"""
+    return PM25Forecaster(model_filepath=model_filepath, scaler_filepath=scaler_filepath)
+
+def _get_ensemble()->ForecastEnsemble:
+    """Get the ensemble of the published models"""
+    return _load_ensemble(
+        tuple((name, _runtime_filepath(filepath)) for name, filepath in ENSEMBLE_MODELS.items()),
+        _runtime_filepath(SCALER_FILEPATH)
+    )
+
+@lru_cache(maxsize=2)
+def _load_ensemble(model_filepaths:tuple, scaler_filepath:Path)->ForecastEnsemble:
+    """Load every model of the ensemble once per process and version"""
+    return ForecastEnsemble(
+        model_filepaths=dict(model_filepaths),
+        scaler_filepath=scaler_filepath,
+        weights=ENSEMBLE_WEIGHTS
+    )
+
+def _get_multi_forecaster()->MultiPollutantForecaster:
+    """Get the forecaster of the published model of every pollutant"""
+    return _load_multi_forecaster(tuple(
+        (pollutant, _runtime_filepath(model_filepath), _runtime_filepath(scaler_filepath))
+        for pollutant, (model_filepath, scaler_filepath) in POLLUTANT_MODELS.items()
+    ))
+
+@lru_cache(maxsize=2)
+def _load_multi_forecaster(models:tuple)->MultiPollutantForecaster:
+    """Load the model of every pollutant once per process and version"""
+    return MultiPollutantForecaster(models={
+        pollutant: (model_filepath, scaler_filepath)
+        for pollutant, model_filepath, scaler_filepath in models
+    })
+
+@lru_cache(maxsize=None)
+def _get_aqi_calculator()->AqiCalculator:
+    """Create the AQI index calculator once per process"""
+    return AqiCalculator()
+
+def load_models()->None:
+    """Load every model and lookup table of the API. A process that loads
+    them before forking workers shares them with all of its workers"""
+    _get_forecaster()
+    _get_ensemble()
+    _get_multi_forecaster()
+    _get_aqi_calculator()
+    _categories_json()
+    for strategy in [None, "ensemble"]:
+        _model_version(strategy)
+
+def _create_db_manager()->DBManager:
+    """Initialize database manager with the configured credentials, its
+    queries go through the database circuit breaker"""
+    return _db_breaker.protect(DBManager(
+        host=config.host,
+        port=config.port,
+        user=config.user,
+        password=config.password,
+        db=config.db
+    ))
+
+def _forecast_error(e:Exception)->HTTPException:
+    """HTTP error of a failed forecast, 503 while a circuit is open or another
+    process takes too long to ingest today's data"""
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=f"Forecasting unavailable: {e}",
+                             headers={"Retry-After": str(math.ceil(e.retry_after))})
+    if isinstance(e, TimeoutError):
+        return HTTPException(status_code=503, detail=f"Forecasting unavailable: {e}",
+                             headers={"Retry-After": str(SCRAPER_TIMEOUT)})
+    return HTTPException(status_code=500, detail=f"Forecasting failed: {str(e)}")
+
+def _build_forecast(predictions:np.ndarray, aqi_idxs:np.ndarray, recommendations:bool=False,
+                    extra:List[dict]=None)->str:
+    """Serialize a forecast as a JSON array. The AQI category fields of each
+    day are taken from the pre-serialized payloads of the AQI calculator"""
+    aqi_calc = _get_aqi_calculator()
+    category_ids = aqi_calc.get_aqi_category_ids(aqi_idxs)
+
+    forecast = []
+    for i, (prediction, aqi_idx, category_id) in enumerate(zip(predictions, aqi_idxs, category_ids)):
+        fields = {
+            "day": i+1,
+            "pm25": float(prediction),
+            "aqi_num": int(aqi_idx)
+        }
+        if extra:
+            fields |= extra[i]
+
+        payload = aqi_calc.get_category_payload("pm25", category_id, recommendations)
+        forecast.append(f"{json.dumps(fields)[:-1]}, {payload}}}")
+    return f"[{', '.join(forecast)}]"
+
+@lru_cache(maxsize=None)
+def _categories_json()->str:
+    """Serialize every AQI category with its recommendations once"""
+    aqi_calc = _get_aqi_calculator()
+    categories = [
+        "{" + aqi_calc.get_category_payload("pm25", category_id, True) + "}"
+        for category_id in range(len(aqi_calc.aqi_categories))
+    ]
+    return f"{{\"categories\": [{', '.join(categories)}]}}"
+
+def _ingest_todays_data(db:DBManager)->dict:
+    """Scrape today's data, fill its missing values with yesterday's data and
+    insert or update it in the database"""
+    # Initialize scraper
+    scraper = SemadetScraper(attempts=SCRAPER_ATTEMPTS, timeout=SCRAPER_TIMEOUT)
+
+    # Get today's data
+    todays_data = _scraper_breaker.call(scraper.get_todays_data)
+    if not todays_data:
+        raise HTTPException(status_code=500, detail="Scraping returned no data")
+
+    # Fill missing values with yesterday's data
+    interpolate = [key for key, value in todays_data.items() if not value]
+    if interpolate:
+        yesterdays_data = db.get_yesterdays_data()
+        for key in interpolate:
+            todays_data[key] = yesterdays_data.get(key)
+
+    # Insert or update today's data
+    data_id = db.daily_data_exists(todays_data["date"])
+    if data_id:
+        db.update_daily_data(data_id, todays_data)
+    else:
+        db.insert_daily_data(todays_data)
+
+    return todays_data
+
+def _ingest_cycle(db:DBManager, cycle:datetime)->None:
+    """Ingest today's data for an ingestion cycle unless another process
+    already did. The processes coordinate with a lock row in the database,
+    the one taking it scrapes while the others wait for it to complete"""
+    global _ingested_cycle
+    if _ingested_cycle == cycle:
+        return
+
+    name = f"ingest:{cycle.isoformat(timespec='minutes')}"
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + INGESTION_LOCK_WAIT
+    while not db.acquire_lock(name, owner, INGESTION_LOCK_TTL):
+        if db.lock_completed(name):
+            _ingested_cycle = cycle
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for lock {name}")
+        time.sleep(INGESTION_LOCK_POLL)
 
-@app.get("/api/v1/forecast", response_model=ForecastResponse)
-def get_next_seven_day_forecast():
     try:
-        # Initialize database manager
-        db = DBManager(
-            host=config.host,
-            port=config.port,
-            user=config.user,
-            password=config.password,
-            db=config.db
-        )
-
-        # Initialize model and scaler
-        model = PM25Forecaster(
-            model_filepath=Path("models/lstm_seven_step.pkl"),
-            scaler_filepath=Path("models/scaler.save")
-        )
-
-        # Initialize scraper
-        scraper = SemadetScraper()
-        
-        # Initialize AQI index calculator
-        aqi_calc = AqiCalculator()
-
-        # Step 1 - Get today's data
-        todays_data = scraper.get_todays_data()
-        if not todays_data:
-            raise HTTPException(status_code=500, detail="Scraping returned no data")
-
-        # Fill missing values with yesterday's data
-        interpolate = [key for key, value in todays_data.items() if not value]
-        if interpolate:
-            yesterdays_data = db.get_yesterdays_data()
-            for key in interpolate:
-                todays_data[key] = yesterdays_data.get(key)
-
-        # Step 2 - Insert or update today's data
-        data_id = db.daily_data_exists(todays_data["date"])
-        if data_id:
-            db.update_daily_data(data_id, todays_data)
+        _ingest_todays_data(db)
+    except Exception:
+        db.release_lock(name, owner, completed=False)
+        raise
+    db.release_lock(name, owner, completed=True)
+    _ingested_cycle = cycle
+
+def _ingest_once_per_cycle(db:DBManager, now:datetime)->None:
+    """Ingest today's data on the first request of each ingestion cycle. The
+    other requests of the cycle reuse the stored data, and concurrent first
+    requests share a single ingestion"""
+    cycle = http_cache.current_cycle(now, INGESTION_INTERVAL)
+    if _ingested_cycle != cycle:
+        _single_flight.do(("ingest", cycle), lambda: _ingest_cycle(db, cycle))
+
+def _model_version(strategy:Optional[str])->bytes:
+    """Hash of the published model files and weights used by a forecast
+    strategy"""
+    filepaths = [MODEL_FILEPATH] if strategy is None else list(ENSEMBLE_MODELS.values())
+    return _hash_model_files(
+        tuple(model_registry.resolve(filepath) for filepath in filepaths + [SCALER_FILEPATH]),
+        repr(ENSEMBLE_WEIGHTS if strategy else None)
+    )
+
+@lru_cache(maxsize=16)
+def _hash_model_files(filepaths:tuple, weights:str)->bytes:
+    """Hash model files once per process, published versions are never
+    modified"""
+    digest = hashlib.sha256(weights.encode())
+    for filepath in filepaths:
+        digest.update(Path(filepath).read_bytes())
+    return digest.digest()
+
+def _is_stale(entry:dict, strategy:Optional[str], now:datetime)->bool:
+    """Whether a last good forecast is from a past ingestion cycle or from
+    models replaced by a newer version"""
+    return (entry["cycle"] < http_cache.current_cycle(now, INGESTION_INTERVAL)
+            or entry["version"] != _model_version(strategy))
+
+def _update_model_stats(ensemble:ForecastEnsemble, db:DBManager, today:str,
+                        predictions:Dict[str, np.ndarray])->None:
+    """Compare past forecasts with the stored data of the days before today
+    and keep today's forecasts for later comparison"""
+    stats = ensemble.stats
+    pending = [day for day in stats.pending_dates() if day < today]
+    if pending:
+        dates, data = db.get_daily_data_range(pending[0], pending[-1])
+        stats.record_observations(dates, data[:, 0] if len(data) else [])
+        stats.discard_pending(today)
+
+    first_day = date.fromisoformat(today)
+    days = [(first_day + timedelta(days=i+1)).isoformat() for i in range(ensemble.n_pred)]
+    for name, prediction in predictions.items():
+        stats.record_forecast(name, days, prediction)
+
+def _compute_forecast(db:DBManager, monthly_data:np.ndarray, today:str, strategy:Optional[str],
+                      expand:Optional[str], assigned:Optional[str], uncertainty:Optional[str])->str:
+    """Forecast the next seven days with the models of a strategy and
+    serialize the response of `/api/v1/forecast`"""
+    # Step 5 - Get seven day forecast
+    if uncertainty:
+        # Forecast of the data and of its perturbed copies in one call
+        samples = _get_forecaster().forecast_samples(monthly_data, UNCERTAINTY_SAMPLES, UNCERTAINTY_NOISE)
+        predictions, samples = samples[0], samples[1:]
+    elif strategy is None:
+        predictions = _get_forecaster().forecast(monthly_data)
+    else:
+        ensemble = _get_ensemble()
+        model_predictions = ensemble.forecast(monthly_data)
+        _update_model_stats(ensemble, db, today, model_predictions)
+
+        if strategy == "ensemble":
+            combined = ensemble.combine(model_predictions)
+            predictions = combined["mean"]
         else:
-            db.insert_daily_data(todays_data)
+            predictions = model_predictions[assigned]
+
+    # Step 6 - Get AQI and recommendations for each forecast
+    extra = None
+    if strategy == "ensemble":
+        extra = [
+            {"pm25_std": float(std), "pm25_min": float(low), "pm25_max": float(high)}
+            for std, low, high in zip(combined["std"], combined["min"], combined["max"])
+        ]
+    elif strategy == "ab":
+        extra = [{"model": assigned}] * len(predictions)
+    elif uncertainty:
+        lower, upper = np.percentile(samples, UNCERTAINTY_PERCENTILES, axis=0)
+        probabilities = _get_aqi_calculator().get_category_probabilities("pm25", samples)
+        extra = [
+            {"pm25_lower": float(low), "pm25_upper": float(high), "aqi_cat_probs": day_probabilities.tolist()}
+            for low, high, day_probabilities in zip(lower, upper, probabilities)
+        ]
+
+    aqi_idxs = _get_aqi_calculator().get_pollutant_aqi_nums("pm25", predictions)
+    forecast = _build_forecast(predictions, aqi_idxs, expand == "recommendations", extra)
+
+    return f'{{"forecast": {forecast}}}'
+
+def _refresh_forecast(variant:tuple)->dict:
+    """Run the live forecast pipeline for a variant of the request and keep
+    the result as its last good forecast"""
+    strategy, expand, assigned, uncertainty = variant
+    now = datetime.now()
+    db = _create_db_manager()
+
+    # Step 1 and 2 - Get today's data and insert or update it, once per
+    # ingestion cycle
+    _ingest_once_per_cycle(db, now)
+
+    # Step 3 - Get last 30 days of data
+    monthly_data = np.asarray(db.get_last_n_daily_data(N_DAYS), dtype=float)
+
+    # Step 4 - Identify the forecast by its data, models and options
+    version = _model_version(strategy)
+    digest = http_cache.compute_etag(
+        monthly_data.tobytes(),
+        version,
+        f"{strategy}|{expand}|{assigned}|{uncertainty}".encode()
+    )
 
-        # Step 3 - Get last 30 days of data
-        monthly_data = db.get_last_n_daily_data(30)
+    # Step 5 and 6 - Get seven day forecast with its AQI, unless the data
+    # has not changed since the last one. Its encoded bodies are created
+    # when first requested
+    entry = _last_good.get(variant)
+    if entry is None or entry["digest"] != digest:
+        content = _compute_forecast(db, monthly_data, now.date().isoformat(),
+                                    strategy, expand, assigned, uncertainty)
+        entry = {"digest": digest, "content": content, "bodies": {}}
+
+    entry = entry | {"cycle": http_cache.current_cycle(now, INGESTION_INTERVAL),
+                     "version": version, "updated": now}
+    _last_good[variant] = entry
+    return entry
+
+def _encoded_body(entry:dict, encoding:Optional[str])->tuple:
+    """ETag and body of a last good forecast in an encoding. Each encoding is
+    compressed once per forecast and gets its own ETag"""
+    encoded = entry["bodies"].get(encoding)
+    if encoded is None:
+        etag = http_cache.compute_etag(entry["digest"].encode(), str(encoding).encode())
+        encoded = (etag, http_cache.encode(entry["content"].encode(), encoding))
+        entry["bodies"][encoding] = encoded
+    return encoded
+
+@app.get("/api/v1/forecast", response_model=ForecastResponse)
+def get_next_seven_day_forecast(request:Request, strategy:Optional[Literal["ensemble", "ab"]]=None,
+                                expand:Optional[Literal["recommendations"]]=None,
+                                uncertainty:Optional[Literal["montecarlo"]]=None):
+    """Forecast the next seven days. By default a single model is used. With
+    `strategy=ensemble` every model is run and the days get the mean and
+    spread of their predictions. With `strategy=ab` the client is assigned to
+    one of the models, identified by the `X-Client-Id` header or its address.
+    Recommendations are only included with `expand=recommendations`, they can
+    also be looked up by `aqi_cat_id` in `/api/v1/aqi/categories`.
+
+    With `uncertainty=montecarlo` the default model also forecasts perturbed
+    copies of the data in the same inference call, and each day gets the
+    bounds of its prediction interval and the probability of each AQI
+    category, ordered by `aqi_cat_id`.
+
+    The response has an ETag of the input data and models, it is fresh until
+    the next ingestion cycle and `If-None-Match` gets a 304 if unchanged. It is
+    compressed with brotli or gzip if the client accepts it.
+
+    Once a new ingestion cycle starts or a new version of the models is
+    published, the last good forecast is returned right away with `stale` and
+    its `age` in seconds while it is refreshed in the background, so failures
+    of the scraper, the database or the models do not reach the clients."""
+    if uncertainty and strategy:
+        raise HTTPException(status_code=400, detail="uncertainty is only available for the default model")
+
+    now = datetime.now()
+    try:
+        assigned = None
+        if strategy == "ab":
+            # Some ASGI servers and test clients do not give the client address
+            client_id = (request.headers.get("X-Client-Id")
+                         or (request.client.host if request.client else ""))
+            assigned = _get_ensemble().assign(client_id)
+
+        encoding = http_cache.choose_encoding(request.headers.get("Accept-Encoding"))
+        variant = (strategy, expand, assigned, uncertainty)
+
+        entry = _last_good.get(variant)
+        if entry is None:
+            # Nothing to fall back to, wait for the pipeline
+            entry = _single_flight.do(("refresh", variant), lambda: _refresh_forecast(variant))
+        elif _is_stale(entry, strategy, now):
+            # Serve the last good forecast while a new one is computed
+            _single_flight.do_in_background(("refresh", variant), lambda: _refresh_forecast(variant))
+
+    except Exception as e:
+        raise _forecast_error(e)
+
+    headers = {
+        "Vary": "Accept-Encoding, X-Client-Id" if strategy == "ab" else "Accept-Encoding"
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    if _is_stale(entry, strategy, now):
+        age = int((now - entry["updated"]).total_seconds())
+        content = f'{entry["content"][:-1]}, "stale": true, "age": {age}}}'
+        headers |= {"Cache-Control": "no-cache", "Age": str(age)}
+        return Response(content=http_cache.encode(content.encode(), encoding),
+                        media_type="application/json", headers=headers)
+
+    etag, body = _encoded_body(entry, encoding)
+    max_age = http_cache.seconds_until_next_cycle(now, INGESTION_INTERVAL)
+    headers |= {
+        "ETag": etag,
+        # A/B responses depend on the client, shared caches must not keep them
+        "Cache-Control": f"{'private' if strategy == 'ab' else 'public'}, max-age={max_age}"
+    }
+
+    # The client already has this forecast
+    if http_cache.etag_matches(request.headers.get("If-None-Match"), etag):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+
+    # Step 7 - Return forecast
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/v1/forecast/pollutants")
+def get_pollutants_forecast(expand:Optional[Literal["recommendations"]]=None):
+    """Forecast the next seven days of every pollutant with a model, with a
+    single inference call. The AQI of each day is the maximum AQI among the
+    pollutants, and `dominant_pollutant` is the pollutant that sets it."""
+    try:
+        db = _create_db_manager()
+        model = _get_multi_forecaster()
+
+        # Step 1 and 2 - Get today's data and insert or update it, once per
+        # ingestion cycle
+        _ingest_once_per_cycle(db, datetime.now())
+
+        # Step 3 - Get last 30 days of data of every pollutant
+        monthly_data = db.get_last_n_daily_data(N_DAYS, pollutants=model.pollutants)
+
+        # Step 4 - Get seven day forecast of every pollutant
+        predictions = model.forecast(np.asarray(monthly_data, dtype=float))
+
+        # Step 5 - Get the AQI of each pollutant and the overall AQI
+        aqi_calc = _get_aqi_calculator()
+        aqi_idxs, dominant = aqi_calc.get_overall_aqi_nums(predictions)
+        category_ids = aqi_calc.get_aqi_category_ids(aqi_idxs)
+        pollutant_aqi_idxs = {
+            pollutant: aqi_calc.get_pollutant_aqi_nums(pollutant, values)
+            for pollutant, values in predictions.items()
+        }
 
-        # Step 4 - Get seven day forecast
-        predictions = model.forecast(monthly_data)
-        
         forecast = []
-        
-        # Step 5 - Get AQI and recommendations for each forecast
-        for i, prediction in enumerate(predictions):
-            aqi_idx = aqi_calc.get_pollutant_aqi_num("pm25", prediction)
-            aqi_cat, aqi_color = aqi_calc.get_pollutant_aqi_str(aqi_idx)
-            recom = aqi_calc.get_aqi_recommendations("pm25", aqi_cat)
-            
-            forecast.append({
+        for i in range(model.n_pred):
+            fields = {
                 "day": i+1,
-                "pm25": prediction,
-                "aqi_num": aqi_idx,
-                "aqi_cat": aqi_cat,
-                "aqi_color": aqi_color,
-                "recommendations": recom
-            })
+                "pollutants": {
+                    pollutant: {
+                        "value": float(predictions[pollutant][i]),
+                        "aqi_num": int(pollutant_aqi_idxs[pollutant][i])
+                    }
+                    for pollutant in model.pollutants
+                },
+                "aqi_num": int(aqi_idxs[i]),
+                "dominant_pollutant": dominant[i]
+            }
+            payload = aqi_calc.get_category_payload(dominant[i], category_ids[i],
+                                                    expand == "recommendations")
+            forecast.append(f"{json.dumps(fields)[:-1]}, {payload}}}")
 
-        # Step 5 - Return forecast
-        return {"forecast": forecast}
+        # Step 6 - Return forecast
+        return Response(content=f'{{"forecast": [{", ".join(forecast)}]}}', media_type="application/json")
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Forecasting failed: {str(e)}")
+        raise _forecast_error(e)
+
+@app.get("/api/v1/models/stats")
+def get_model_stats():
+    """Latency and accuracy of each model served by the ensemble and A/B
+    strategies since the server started, and latency of the inference calls
+    that run all of them"""
+    stats = _get_ensemble().stats
+    return {"models": stats.summary(), "inference": stats.call_summary()}
+
+@app.get("/api/v1/health")
+def get_health():
+    """State of the circuit breakers, published version of each model and
+    age in seconds of the last good forecast of each variant of
+    `/api/v1/forecast`"""
+    now = datetime.now()
+    forecasts = [
+        {
+            "strategy": strategy,
+            "expand": expand,
+            "model": assigned,
+            "uncertainty": uncertainty,
+            "age": int((now - entry["updated"]).total_seconds()),
+            "stale": _is_stale(entry, strategy, now)
+        }
+        for (strategy, expand, assigned, uncertainty), entry in list(_last_good.items())
+    ]
+    return {
+        "circuits": {"scraper": _scraper_breaker.status(), "database": _db_breaker.status()},
+        "ingested_cycle": _ingested_cycle.isoformat() if _ingested_cycle else None,
+        "model_versions": {
+            Path(filepath).stem: (model_registry.current(filepath) or {}).get("version", 0)
+            for filepath in dict.fromkeys([MODEL_FILEPATH, *ENSEMBLE_MODELS.values()])
+        },
+        "forecasts": forecasts
+    }
+
+@app.get("/api/v1/aqi/categories")
+def get_aqi_categories():
+    """Name, color and recommendations of each AQI category by `aqi_cat_id`"""
+    return Response(content=_categories_json(), media_type="application/json")
+
+def _forecast_batch_chunk(db:DBManager, model:PM25Forecaster, as_of_dates:List[date],
+                         expand:Optional[str])->List[str]:
+    """Forecast a chunk of sorted dates with a single range query and a single
+    inference call, and serialize the NDJSON line of each date"""
+    # Step 1 - Get every needed day with a single range query
+    first_date = as_of_dates[0] - timedelta(days=N_DAYS - 1)
+    dates, data = db.get_daily_data_range(first_date.isoformat(),
+                                          as_of_dates[-1].isoformat())
+    positions = {day: i for i, day in enumerate(dates)}
+
+    # Step 2 - Keep dates with N_DAYS consecutive days of data
+    available, ends = [], []
+    for as_of in as_of_dates:
+        end = positions.get(as_of.isoformat())
+        start = positions.get((as_of - timedelta(days=N_DAYS - 1)).isoformat())
+        if end is not None and start is not None and end - start == N_DAYS - 1:
+            available.append(as_of)
+            ends.append(end)
+
+    predictions, aqi_idxs = {}, {}
+    if available:
+        # Step 3 - Build the data of every date in one pass, newest day
+        # first like `get_last_n_daily_data`
+        windows = np.lib.stride_tricks.sliding_window_view(data, N_DAYS, axis=0)
+        windows = np.swapaxes(windows, 1, 2)[np.asarray(ends) - (N_DAYS - 1), ::-1]
+
+        # Step 4 - Forecast every date with a single inference call
+        batch_predictions = model.forecast_batch(windows)
+
+        # Step 5 - Get AQI of every forecast at once
+        batch_aqi_idxs = _get_aqi_calculator().get_pollutant_aqi_nums("pm25", batch_predictions)
+
+        predictions = dict(zip(available, batch_predictions))
+        aqi_idxs = dict(zip(available, batch_aqi_idxs))
+
+    lines = []
+    for as_of in as_of_dates:
+        if as_of in predictions:
+            forecast = _build_forecast(predictions[as_of], aqi_idxs[as_of],
+                                       expand == "recommendations")
+            lines.append(f'{{"date": "{as_of.isoformat()}", "forecast": {forecast}}}\n')
+        else:
+            error = f"Not enough data: {N_DAYS} consecutive days are needed"
+            lines.append(json.dumps({"date": as_of.isoformat(), "error": error}) + "\n")
+    return lines
+
+def _chunk_dates(as_of_dates:List[date])->List[List[date]]:
+    """Split sorted dates into chunks spanning at most `BATCH_CHUNK_DATES`
+    days, so the range query of a chunk reads at most
+    `BATCH_CHUNK_DATES + N_DAYS - 1` days however sparse the dates are"""
+    chunks = []
+    for as_of in as_of_dates:
+        if chunks and (as_of - chunks[-1][0]).days < BATCH_CHUNK_DATES:
+            chunks[-1].append(as_of)
+        else:
+            chunks.append([as_of])
+    return chunks
+
+@app.post("/api/v1/forecast/batch")
+def get_batch_forecast(request:BatchForecastRequest, expand:Optional[Literal["recommendations"]]=None):
+    """Forecast from several past dates at once. The response is streamed as
+    newline-delimited JSON, one line per requested date, in date order. The
+    dates are forecast in chunks spanning `BATCH_CHUNK_DATES` days as the
+    response is sent, so memory does not grow with the number of dates or
+    with the time between them."""
+    chunks = _chunk_dates(request.as_of_dates())
+
+    # The first chunk is forecast before responding, so failures still get
+    # an error status
+    try:
+        db = _create_db_manager()
+        model = _get_forecaster()
+        first_lines = _forecast_batch_chunk(db, model, chunks[0], expand)
+    except Exception as e:
+        raise _forecast_error(e)
+
+    def stream()->Iterator[str]:
+        yield from first_lines
+        for chunk in chunks[1:]:
+            try:
+                lines = _forecast_batch_chunk(db, model, chunk, expand)
+            except Exception as e:
+                # The status was already sent, report the failure in the
+                # line of each date of the chunk
+                error = f"Forecasting failed: {e}"
+                lines = [json.dumps({"date": as_of.isoformat(), "error": error}) + "\n" for as_of in chunk]
+            yield from lines
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
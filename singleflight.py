@@ -0,0 +1,91 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+class _Call:
+    """
+    Computation in flight and its outcome.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one execution. The first
+    caller runs the function, the callers that arrive while it runs wait for
+    it and receive the same result or exception.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+        # Calls answered with another call's result
+        self.shared = 0
+
+    def do(self, key:Hashable, fn:Callable[[], Any])->Any:
+        """Run a function unless a call with the same key is in flight, in
+        which case wait for that call instead.
+
+        Args:
+            key (Hashable): Identifier of the computation.
+            fn (Callable[[], Any]): Function without arguments to run.
+
+        Returns:
+            Any: Result of the function.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        return self._run(key, call, fn)
+
+    def do_in_background(self, key:Hashable, fn:Callable[[], Any])->bool:
+        """Run a function in a background thread unless a call with the same
+        key is in flight. Errors are printed since nobody waits for them.
+
+        Args:
+            key (Hashable): Identifier of the computation.
+            fn (Callable[[], Any]): Function without arguments to run.
+
+        Returns:
+            bool: True if the function was started.
+        """
+        with self.lock:
+            if key in self.calls:
+                return False
+            call = self.calls[key] = _Call()
+
+        def run()->None:
+            try:
+                self._run(key, call, fn)
+            except Exception as e:
+                print(f"Background call {key} failed: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def _run(self, key:Hashable, call:_Call, fn:Callable[[], Any])->Any:
+        """Run the function of a call and wake up its waiters."""
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Later calls start a new computation
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,80 @@
+import gzip
+from datetime import datetime, timedelta
+
+import pytest
+
+import http_cache
+
+ETAG = '"0123456789abcdef0123456789abcdef"'
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    (None, False),
+    ("", False),
+    (ETAG, True),
+    (f"W/{ETAG}", True),
+    (f'"other", {ETAG}', True),
+    (f'"other",{ETAG}', True),
+    ("*", True),
+    ('"other"', False),
+    (ETAG[:-1], False)
+])
+def test_etag_matches(if_none_match, expected):
+    assert http_cache.etag_matches(if_none_match, ETAG) is expected
+
+def test_compute_etag_depends_on_every_part():
+    etag = http_cache.compute_etag(b"data", b"model")
+    assert etag == http_cache.compute_etag(b"data", b"model")
+    assert etag != http_cache.compute_etag(b"data", b"other")
+    # Parts are hashed separately, moving bytes between them changes the tag
+    assert etag != http_cache.compute_etag(b"datam", b"odel")
+    assert etag.startswith('"') and etag.endswith('"') and len(etag) == 34
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=abc", None),
+    ("*", "gzip"),
+    ("br", None),
+    ("br, gzip", "gzip"),
+    ("gzip;q=0, *", None),
+    ("*, gzip;q=0", None),
+    ("gzip;q=0.5, identity", None)
+])
+def test_choose_encoding_without_brotli(monkeypatch, accept_encoding, expected):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    assert http_cache.choose_encoding(accept_encoding) == expected
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("br", "br"),
+    ("gzip, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("*", "br"),
+    ("identity", None),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0.8, gzip;q=0.9", "gzip"),
+    ("gzip;q=0.5, br;q=0.5", "br"),
+    ("br;q=0, *", "gzip"),
+    ("br;q=0, gzip;q=0, *", None),
+    ("gzip;q=0.3, *;q=0.6", "br")
+])
+def test_choose_encoding_with_brotli(monkeypatch, accept_encoding, expected):
+    monkeypatch.setattr(http_cache, "brotli", object())
+    assert http_cache.choose_encoding(accept_encoding) == expected
+
+def test_gzip_is_deterministic():
+    body = b'{"forecast": []}' * 10
+    encoded = http_cache.encode(body, "gzip")
+    assert encoded == http_cache.encode(body, "gzip")
+    assert gzip.decompress(encoded) == body
+    assert http_cache.encode(body, None) == body
+
+def test_cycles():
+    interval = timedelta(minutes=60)
+    now = datetime(2024, 5, 1, 10, 15, 30)
+    assert http_cache.current_cycle(now, interval) == datetime(2024, 5, 1, 10)
+    assert http_cache.seconds_until_next_cycle(now, interval) == 44 * 60 + 30
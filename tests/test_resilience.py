@@ -0,0 +1,116 @@
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError
+
+class Clock:
+    """Replacement of `time.monotonic` moved by hand."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self)->float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch)->Clock:
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+def fail():
+    raise RuntimeError("down")
+
+def trip(breaker:CircuitBreaker)->None:
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("db", failure_threshold=2, reset_timeout=30)
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.status() == {"state": "closed", "failures": 1}
+
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.status()["state"] == "open"
+
+    calls = []
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.call(calls.append, 1)
+    assert calls == []
+    assert error.value.name == "db"
+    assert error.value.retry_after == pytest.approx(20)
+
+def test_success_resets_the_failures(clock):
+    breaker = CircuitBreaker("db", failure_threshold=2, reset_timeout=30)
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.call(lambda: "ok") == "ok"
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.status() == {"state": "closed", "failures": 1}
+
+def test_successful_trial_closes_the_circuit(clock):
+    breaker = CircuitBreaker("db", failure_threshold=2, reset_timeout=30)
+    trip(breaker)
+    clock.now += 30
+    assert breaker.status()["state"] == "half_open"
+
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.status() == {"state": "closed", "failures": 0}
+    assert not breaker.trial_in_flight
+
+def test_failed_trial_opens_the_circuit_again(clock):
+    breaker = CircuitBreaker("db", failure_threshold=2, reset_timeout=30)
+    trip(breaker)
+    clock.now += 30
+
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.status()["state"] == "open"
+    assert not breaker.trial_in_flight
+
+    # The timeout starts again from the failed trial
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "ok")
+    clock.now += 1
+    assert breaker.call(lambda: "ok") == "ok"
+
+def test_only_one_trial_while_half_open(clock):
+    breaker = CircuitBreaker("db", failure_threshold=1, reset_timeout=30)
+    trip(breaker)
+    clock.now += 30
+
+    def trial():
+        assert breaker.trial_in_flight
+        # Calls arriving during the trial are rejected
+        with pytest.raises(CircuitOpenError) as error:
+            breaker.call(lambda: "other")
+        assert error.value.retry_after == 0
+        return "trial"
+
+    assert breaker.call(trial) == "trial"
+    assert breaker.call(lambda: "ok") == "ok"
+
+def test_protect_runs_methods_through_the_circuit(clock):
+    class Database:
+        host = "localhost"
+
+        def query(self, value):
+            return value
+
+        def broken(self):
+            fail()
+
+    breaker = CircuitBreaker("db", failure_threshold=1, reset_timeout=30)
+    db = breaker.protect(Database())
+    assert db.host == "localhost"
+    assert db.query(3) == 3
+
+    with pytest.raises(RuntimeError):
+        db.broken()
+    with pytest.raises(CircuitOpenError):
+        db.query(3)
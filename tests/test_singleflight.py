@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+def wait_for(condition, timeout:float=5)->None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.001)
+
+def fail():
+    raise RuntimeError("down")
+
+def run_concurrently(flight:SingleFlight, key, fn, n_callers:int)->tuple:
+    """Call `flight.do` from several threads, and return the threads and the
+    list where each caller puts what it got."""
+    outcomes = [None] * n_callers
+
+    def caller(i:int)->None:
+        try:
+            outcomes[i] = ("result", flight.do(key, fn))
+        except Exception as e:
+            outcomes[i] = ("error", e)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(n_callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+
+    def fn():
+        executions.append(1)
+        release.wait()
+        return object()
+
+    threads, outcomes = run_concurrently(flight, "key", fn, 8)
+    wait_for(lambda: "key" in flight.calls and flight.calls["key"].waiters == 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(executions) == 1
+    assert flight.shared == 7
+    assert len({id(result) for _, result in outcomes}) == 1
+    assert flight.calls == {}
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = RuntimeError("down")
+
+    def fn():
+        release.wait()
+        raise error
+
+    threads, outcomes = run_concurrently(flight, "key", fn, 4)
+    wait_for(lambda: "key" in flight.calls and flight.calls["key"].waiters == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes == [("error", error)] * 4
+    assert flight.calls == {}
+
+def test_key_is_released_after_each_call():
+    flight = SingleFlight()
+    with pytest.raises(RuntimeError):
+        flight.do("key", fail)
+    assert flight.calls == {}
+
+    # A failed call does not stick, the next one runs again
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.shared == 0
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: "a") == "a"
+    assert flight.do("b", lambda: "b") == "b"
+
+def test_background_call_is_not_repeated_while_in_flight():
+    flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+
+    def fn():
+        executions.append(1)
+        release.wait()
+
+    assert flight.do_in_background("key", fn)
+    assert not flight.do_in_background("key", fn)
+    release.set()
+    wait_for(lambda: flight.calls == {})
+
+    assert executions == [1]
+    assert flight.do_in_background("key", lambda: None)
+    wait_for(lambda: flight.calls == {})
+
+def test_background_error_is_printed_and_released(capsys):
+    flight = SingleFlight()
+    output = []
+
+    assert flight.do_in_background("key", fail)
+    wait_for(lambda: output.append(capsys.readouterr().out) or "down" in "".join(output))
+    assert flight.calls == {}
+    assert flight.do("key", lambda: "ok") == "ok"